@@ -15,5 +15,7 @@ if [ -n "${DJANGO_SUPERUSER_USERNAME:-}" ] && [ -n "${DJANGO_SUPERUSER_PASSWORD:
     uv run --no-sync python manage.py createsuperuser --noinput || true
 fi
 
-echo "Start gunicorn..."
-exec uv run --no-sync gunicorn config.wsgi:application --bind 0.0.0.0:4444 --access-logfile -
+echo "Start uvicorn..."
+# Sync views and the async ORM share one thread per process, so run several
+exec uv run --no-sync uvicorn config.asgi:application --host 0.0.0.0 --port 4444 \
+    --workers "${WEB_CONCURRENCY:-2}"
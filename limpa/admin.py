@@ -1,11 +1,19 @@
 from django.contrib import admin
 
-from limpa.models import Podcast
+from limpa.models import Episode, Podcast
 
 
 @admin.register(Podcast)
 class PodcastAdmin(admin.ModelAdmin):
-    list_display = ["title", "status", "created_at"]
-    list_filter = ["status"]
+    list_display = ["title", "status", "output_profile", "created_at"]
+    list_filter = ["status", "output_profile"]
     search_fields = ["title", "url"]
     readonly_fields = ["url_hash", "created_at"]
+
+
+@admin.register(Episode)
+class EpisodeAdmin(admin.ModelAdmin):
+    list_display = ["title", "podcast", "status", "published_at", "processed_at"]
+    list_filter = ["status"]
+    search_fields = ["title", "guid"]
+    raw_id_fields = ["podcast"]
@@ -0,0 +1,125 @@
+"""Single-flight processing through `ProcessingLease` rows.
+
+A task run takes a lease on the podcast and on every episode it works on.
+Another run (an overlapping `refresh_feeds`, a second enqueue from
+`add_podcast`, a `reprocess`) that finds a key already leased skips that work
+instead of downloading, transcribing and extracting it a second time. Leases
+are renewed from a background thread while the run is alive, so a crashed
+worker only blocks the work until its leases expire.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import timedelta
+from typing import TYPE_CHECKING
+
+from django.db import connection
+
+from limpa.models import ProcessingLease
+
+if TYPE_CHECKING:
+    from collections.abc import Iterator
+
+logger = logging.getLogger(__name__)
+
+
+def podcast_key(podcast_id: int) -> str:
+    return f"podcast:{podcast_id}"
+
+
+def episode_key(podcast_id: int, guid: str) -> str:
+    # GUIDs are often full URLs, so keep the key short
+    return f"episode:{podcast_id}:{hashlib.sha256(guid.encode()).hexdigest()[:32]}"
+
+
+def claim_episode(podcast_id: int, guid: str, ttl_seconds: float) -> bool:
+    """Take a short-lived claim on an episode a listener asked for, so further
+    requests don't enqueue it again while its run is still queued."""
+    return ProcessingLease.acquire(
+        f"claim:{episode_key(podcast_id, guid)}",
+        owner=_new_owner(),
+        ttl=timedelta(seconds=ttl_seconds),
+    )
+
+
+def store_key(*parts: str) -> str:
+    """Key for a shared object that workers read, modify and write back."""
+    return ":".join(["store", *parts])
+
+
+def _new_owner() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+@contextmanager
+def exclusive(
+    keys: list[str], timeout_seconds: float = 300, ttl_seconds: float = 300
+) -> Iterator[bool]:
+    """Hold every one of `keys` for a short read-modify-write, waiting up to
+    `timeout_seconds` for other holders. Yields whether they were acquired."""
+    owner = _new_owner()
+    ttl = timedelta(seconds=ttl_seconds)
+    deadline = time.monotonic() + timeout_seconds
+    held: list[str] = []
+    # Always taken in the same order, so two holders can't wait on each other
+    for key in sorted(keys):
+        while not ProcessingLease.acquire(key, owner=owner, ttl=ttl):
+            if time.monotonic() >= deadline:
+                logger.warning(f"Timed out waiting for {key}")
+                ProcessingLease.release(held, owner=owner)
+                yield False
+                return
+            time.sleep(1)
+        held.append(key)
+    try:
+        yield True
+    finally:
+        ProcessingLease.release(held, owner=owner)
+
+
+class Leases:
+    """The leases held by one task run, released when the block exits."""
+
+    def __init__(self, ttl_seconds: float):
+        self.ttl = timedelta(seconds=ttl_seconds)
+        self.owner = _new_owner()
+        self.keys: list[str] = []
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._heartbeat = threading.Thread(
+            target=self._renew_until_stopped, name="lease-heartbeat", daemon=True
+        )
+
+    def acquire(self, key: str) -> bool:
+        if not ProcessingLease.acquire(key, owner=self.owner, ttl=self.ttl):
+            logger.info(f"{key} is already being processed, skipping")
+            return False
+        with self._lock:
+            self.keys.append(key)
+        return True
+
+    def _renew_until_stopped(self) -> None:
+        try:
+            while not self._stopped.wait(self.ttl.total_seconds() / 3):
+                with self._lock:
+                    keys = list(self.keys)
+                ProcessingLease.renew(keys, owner=self.owner, ttl=self.ttl)
+        finally:
+            connection.close()
+
+    def __enter__(self) -> Leases:
+        self._heartbeat.start()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self._stopped.set()
+        self._heartbeat.join()
+        ProcessingLease.release(self.keys, owner=self.owner)
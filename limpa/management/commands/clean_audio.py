@@ -2,8 +2,8 @@ from pathlib import Path
 
 from django.core.management.base import BaseCommand
 
-from limpa.services.audio import remove_ads_from_audio
-from limpa.services.extract import extract_from_transcription
+from limpa.services.audio import OUTPUT_PROFILES, remove_ads_from_audio
+from limpa.services.extract import extract_ads
 from limpa.services.transcribe import transcribe_audio_batch
 
 
@@ -14,6 +14,12 @@ class Command(BaseCommand):
         parser.add_argument(
             "audio_file", type=str, help="Path to the audio file to clean"
         )
+        parser.add_argument(
+            "--profile",
+            choices=OUTPUT_PROFILES,
+            default="copy",
+            help="Output profile (default: copy)",
+        )
         parser.add_argument(
             "-o",
             "--output",
@@ -32,6 +38,9 @@ class Command(BaseCommand):
             output_path = Path(options["output"])
         else:
             output_path = audio_path.with_stem(f"{audio_path.stem}_clean")
+            if options["profile"] != "copy":
+                extension = OUTPUT_PROFILES[options["profile"]].extension
+                output_path = output_path.with_suffix(f".{extension}")
 
         self.stdout.write(f"Transcribing {audio_path}...")
         audio_bytes = audio_path.read_bytes()
@@ -46,7 +55,7 @@ class Command(BaseCommand):
         self.stdout.write(f"Transcript saved to: {transcript_path}")
 
         self.stdout.write("\nExtracting ads from transcription...")
-        ads = extract_from_transcription(transcription)
+        ads = extract_ads(transcription)
 
         if not ads.ads_list:
             self.stdout.write(self.style.WARNING("No ads detected"))
@@ -59,6 +68,11 @@ class Command(BaseCommand):
             )
 
         self.stdout.write(f"\nRemoving ads and saving to {output_path}...")
-        remove_ads_from_audio(input_path=audio_path, ads=ads, output_path=output_path)
+        remove_ads_from_audio(
+            input_path=audio_path,
+            ads=ads,
+            profile=OUTPUT_PROFILES[options["profile"]],
+            output_path=output_path,
+        )
 
         self.stdout.write(self.style.SUCCESS(f"Cleaned audio saved to: {output_path}"))
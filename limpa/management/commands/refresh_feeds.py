@@ -1,24 +1,74 @@
+from datetime import timedelta
+
+from django.conf import settings
 from django.core.management.base import BaseCommand
+from django.db.models import Q
+from django.utils import timezone
 
-from limpa.models import Podcast
+from limpa.leases import podcast_key
+from limpa.models import Podcast, ProcessingLease
+from limpa.services.schedule import refresh_priority
 from limpa.tasks import process_podcast
 
 
 class Command(BaseCommand):
-    help = "Refresh all podcast feeds by processing their latest episodes"
+    help = (
+        "Enqueue processing for podcasts whose next refresh is due, spread "
+        "over the scheduling window"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--all",
+            action="store_true",
+            help="Refresh every podcast now, whether it is due or not",
+        )
 
     def handle(self, *args, **options):
-        podcasts = Podcast.objects.all()
-        count = podcasts.count()
+        now = timezone.now()
+        # Podcasts never refreshed are still being onboarded (or failed to be),
+        # and onboard_podcast starts their first refresh
+        podcasts = Podcast.objects.only(
+            "title", "publish_interval_hours", "next_refresh_at"
+        ).filter(last_refreshed_at__isnull=False)
+        if not options["all"]:
+            # Podcasts never scheduled fall back to when they were last refreshed
+            default_interval = timedelta(hours=settings.SCHEDULE_DEFAULT_INTERVAL_HOURS)
+            podcasts = podcasts.filter(
+                Q(next_refresh_at__lte=now)
+                | Q(
+                    next_refresh_at__isnull=True,
+                    last_refreshed_at__lte=now - default_interval,
+                )
+            )
 
-        if count == 0:
-            self.stdout.write("No podcasts to refresh")
+        in_flight = ProcessingLease.held([podcast_key(p.id) for p in podcasts])
+        due = [p for p in podcasts if podcast_key(p.id) not in in_flight]
+        if not due:
+            self.stdout.write("No podcasts due for refresh")
             return
 
-        for podcast in podcasts:
-            process_podcast.enqueue(podcast_id=podcast.id)  # type: ignore[attr-defined]
-            self.stdout.write(f"Enqueued processing for: {podcast.title}")
+        # Most frequent publishers go first and get the higher priority; the
+        # rest are spread evenly over the window to smooth the worker load
+        due.sort(key=lambda p: p.publish_interval_hours or float("inf"))
+        window = timedelta(minutes=settings.SCHEDULE_WINDOW_MINUTES)
+        retry_at = now + timedelta(hours=settings.SCHEDULE_DEFAULT_INTERVAL_HOURS)
+        for i, podcast in enumerate(due):
+            run_after = None if options["all"] else now + window * i / len(due)
+            process_podcast.using(  # type: ignore[attr-defined]
+                run_after=run_after,
+                priority=refresh_priority(podcast.publish_interval_hours),
+            ).enqueue(podcast_id=podcast.id)
+            # Replaced by the learned schedule when the run finishes; keeps a
+            # failed or still queued run from being enqueued every hour
+            Podcast.objects.filter(pk=podcast.pk).update(next_refresh_at=retry_at)
+            when = f" (at {run_after:%H:%M})" if run_after else ""
+            self.stdout.write(f"Enqueued processing for: {podcast.title}{when}")
 
+        skipped = len(in_flight)
         self.stdout.write(
-            self.style.SUCCESS(f"Enqueued {count} podcast(s) for refresh")
+            self.style.SUCCESS(
+                f"Enqueued {len(due)} podcast(s) for refresh"
+                + (f", skipped {skipped} already processing" if skipped else "")
+            )
         )
@@ -0,0 +1,100 @@
+from collections import defaultdict
+from datetime import date
+
+from django.core.management.base import BaseCommand
+from django.db.models import F
+from django.db.models.functions import Coalesce, TruncDate
+
+from limpa.models import Episode
+from limpa.services.extract import PROMPT_VERSION
+from limpa.tasks import reprocess_podcast
+
+
+class Command(BaseCommand):
+    help = (
+        "Re-run ad extraction on processed episodes using their stored "
+        "transcripts, without transcribing them again"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--podcast",
+            type=int,
+            action="append",
+            dest="podcast_ids",
+            help="Podcast id to reprocess (repeatable, default: all podcasts)",
+        )
+        parser.add_argument(
+            "--since",
+            type=date.fromisoformat,
+            help="Only episodes published on or after this date (YYYY-MM-DD)",
+        )
+        parser.add_argument(
+            "--until",
+            type=date.fromisoformat,
+            help="Only episodes published on or before this date (YYYY-MM-DD)",
+        )
+        parser.add_argument(
+            "--prompt-version",
+            type=int,
+            help="Only episodes processed with this prompt version "
+            "(episodes from before versioning count as 0)",
+        )
+        parser.add_argument(
+            "--stale",
+            action="store_true",
+            help=f"Only episodes processed with a prompt older than "
+            f"the current one ({PROMPT_VERSION})",
+        )
+        parser.add_argument(
+            "--profile-changed",
+            action="store_true",
+            help="Only episodes written with another output profile than "
+            "their podcast's current one",
+        )
+
+    def handle(self, *args, **options):
+        episodes = Episode.objects.filter(status=Episode.Status.READY)
+        if options["podcast_ids"]:
+            episodes = episodes.filter(podcast_id__in=options["podcast_ids"])
+        if options["stale"]:
+            episodes = episodes.filter(prompt_version__lt=PROMPT_VERSION)
+        if options["profile_changed"]:
+            episodes = episodes.exclude(output_profile=F("podcast__output_profile"))
+        if options["prompt_version"] is not None:
+            episodes = episodes.filter(prompt_version=options["prompt_version"])
+        if options["since"] or options["until"]:
+            # Episodes processed before publish dates were stored fall back to
+            # when they were processed
+            episodes = episodes.annotate(
+                episode_date=TruncDate(Coalesce("published_at", "processed_at"))
+            )
+            if options["since"]:
+                episodes = episodes.filter(episode_date__gte=options["since"])
+            if options["until"]:
+                episodes = episodes.filter(episode_date__lte=options["until"])
+
+        guids_by_podcast: dict[int, list[str]] = defaultdict(list)
+        titles: dict[int, str] = {}
+        for podcast_id, podcast_title, guid in episodes.values_list(
+            "podcast_id", "podcast__title", "guid"
+        ).iterator():
+            guids_by_podcast[podcast_id].append(guid)
+            titles[podcast_id] = podcast_title
+
+        if not guids_by_podcast:
+            self.stdout.write("No episodes to reprocess")
+            return
+
+        total = 0
+        for podcast_id, guids in guids_by_podcast.items():
+            reprocess_podcast.enqueue(podcast_id=podcast_id, guids=guids)  # type: ignore[attr-defined]
+            self.stdout.write(
+                f"Enqueued reprocessing of {len(guids)} episode(s) for: "
+                f"{titles[podcast_id]}"
+            )
+            total += len(guids)
+
+        self.stdout.write(
+            self.style.SUCCESS(f"Enqueued {total} episode(s) for reprocessing")
+        )
@@ -0,0 +1,127 @@
+# Generated by Django 6.0 on 2026-10-19 09:12
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.utils.dateparse import parse_datetime
+
+
+def copy_processed_episodes(apps, schema_editor):
+    Podcast = apps.get_model("limpa", "Podcast")
+    Episode = apps.get_model("limpa", "Episode")
+
+    for podcast in Podcast.objects.iterator():
+        Episode.objects.bulk_create(
+            [
+                Episode(
+                    podcast=podcast,
+                    guid=guid,
+                    title=data["title"],
+                    original_url=data["original_url"],
+                    s3_url=data.get("s3_url", ""),
+                    transcript_url=data.get("transcript_url", ""),
+                    ads=data.get("ads", {}),
+                    status="ready",
+                    published_at=parse_datetime(data.get("published_at") or ""),
+                    processed_at=parse_datetime(data.get("processed_at") or ""),
+                    prompt_version=data.get("prompt_version", 0),
+                )
+                for guid, data in podcast.processed_episodes.items()
+            ],
+            batch_size=500,
+        )
+
+
+def copy_episodes_back(apps, schema_editor):
+    Podcast = apps.get_model("limpa", "Podcast")
+    Episode = apps.get_model("limpa", "Episode")
+
+    for podcast in Podcast.objects.iterator():
+        podcast.processed_episodes = {
+            episode.guid: {
+                "original_url": episode.original_url,
+                "title": episode.title,
+                "s3_url": episode.s3_url,
+                "transcript_url": episode.transcript_url,
+                "ads": episode.ads,
+                "published_at": episode.published_at
+                and episode.published_at.isoformat(),
+                "processed_at": episode.processed_at
+                and episode.processed_at.isoformat(),
+                "prompt_version": episode.prompt_version,
+            }
+            for episode in Episode.objects.filter(podcast=podcast, status="ready")
+        }
+        podcast.save(update_fields=["processed_episodes"])
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("limpa", "0004_status_processing_ready"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="Episode",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("guid", models.CharField(max_length=1000)),
+                ("title", models.CharField(max_length=1000)),
+                ("original_url", models.URLField(max_length=2000)),
+                ("s3_url", models.URLField(blank=True, max_length=2000)),
+                ("transcript_url", models.URLField(blank=True, max_length=2000)),
+                ("ads", models.JSONField(default=dict)),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("pending", "Pending"),
+                            ("processing", "Processing"),
+                            ("ready", "Ready"),
+                            ("failed", "Failed"),
+                        ],
+                        default="pending",
+                        max_length=20,
+                    ),
+                ),
+                ("published_at", models.DateTimeField(blank=True, null=True)),
+                ("processed_at", models.DateTimeField(blank=True, null=True)),
+                ("prompt_version", models.PositiveIntegerField(default=0)),
+                (
+                    "podcast",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="episodes",
+                        to="limpa.podcast",
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["status"], name="limpa_episo_status_83a433_idx"
+                    ),
+                    models.Index(
+                        fields=["published_at"], name="limpa_episo_publish_18a695_idx"
+                    ),
+                ],
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("podcast", "guid"), name="unique_podcast_episode_guid"
+                    )
+                ],
+            },
+        ),
+        migrations.RunPython(copy_processed_episodes, copy_episodes_back),
+        migrations.RemoveField(
+            model_name="podcast",
+            name="processed_episodes",
+        ),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 6.0 on 2026-10-19 10:03
+
+from django.db import migrations, models
+
+
+def backfill_counters(apps, schema_editor):
+    Podcast = apps.get_model("limpa", "Podcast")
+    Episode = apps.get_model("limpa", "Episode")
+
+    for podcast in Podcast.objects.iterator():
+        episodes = ads = 0
+        seconds = 0.0
+        for ads_data in Episode.objects.filter(
+            podcast=podcast, status="ready"
+        ).values_list("ads", flat=True):
+            ads_list = ads_data.get("ads_list", [])
+            episodes += 1
+            ads += len(ads_list)
+            seconds += sum(
+                ad["end_timestamp_seconds"] - ad["start_timestamp_seconds"]
+                for ad in ads_list
+            )
+        Podcast.objects.filter(pk=podcast.pk).update(
+            processed_episode_count=episodes,
+            ads_removed_count=ads,
+            seconds_removed=seconds,
+        )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("limpa", "0005_episode"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="podcast",
+            name="processed_episode_count",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="podcast",
+            name="ads_removed_count",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="podcast",
+            name="seconds_removed",
+            field=models.FloatField(default=0),
+        ),
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 6.0 on 2026-10-19 11:20
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("limpa", "0006_podcast_counters"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="podcast",
+            name="updated_at",
+            field=models.DateTimeField(
+                auto_now=True, db_index=True, default=django.utils.timezone.now
+            ),
+            preserve_default=False,
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 6.0 on 2026-10-19 12:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("limpa", "0007_podcast_updated_at"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ProcessingLease",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("key", models.CharField(max_length=255, unique=True)),
+                ("owner", models.CharField(max_length=255)),
+                ("expires_at", models.DateTimeField(db_index=True)),
+            ],
+        ),
+    ]
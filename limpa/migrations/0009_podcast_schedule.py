@@ -0,0 +1,22 @@
+# Generated by Django 6.0 on 2026-10-19 13:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("limpa", "0008_processinglease"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="podcast",
+            name="next_refresh_at",
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="podcast",
+            name="publish_interval_hours",
+            field=models.FloatField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 6.0 on 2026-10-19 14:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("limpa", "0009_podcast_schedule"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="episode",
+            name="audio_hash",
+            field=models.CharField(blank=True, db_index=True, max_length=64),
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 6.0 on 2026-10-19 15:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("limpa", "0010_episode_audio_hash"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="episode",
+            name="audio_mime_type",
+            field=models.CharField(blank=True, max_length=100),
+        ),
+        migrations.AddField(
+            model_name="episode",
+            name="audio_size",
+            field=models.PositiveBigIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="episode",
+            name="output_profile",
+            field=models.CharField(blank=True, max_length=20),
+        ),
+        migrations.AddField(
+            model_name="podcast",
+            name="output_profile",
+            field=models.CharField(
+                choices=[
+                    ("copy", "Copy original"),
+                    ("speech_mp3", "Spoken-word MP3 (64 kbps mono)"),
+                    ("aac_mono", "AAC (48 kbps mono)"),
+                    ("opus", "Opus (24 kbps mono)"),
+                ],
+                default="copy",
+                max_length=20,
+            ),
+        ),
+    ]
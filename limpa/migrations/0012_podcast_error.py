@@ -0,0 +1,17 @@
+# Generated by Django 6.0 on 2026-10-19 16:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("limpa", "0011_output_profiles"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="podcast",
+            name="error",
+            field=models.CharField(blank=True, max_length=500),
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 6.0 on 2026-10-19 17:10
+
+from django.db import migrations, models
+
+
+def create_sequence(apps, schema_editor):
+    apps.get_model("limpa", "ChangeSequence").objects.get_or_create(pk=1)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("limpa", "0012_podcast_error"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ChangeSequence",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("value", models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(create_sequence, migrations.RunPython.noop),
+        migrations.AddField(
+            model_name="podcast",
+            name="change_seq",
+            field=models.BigIntegerField(db_index=True, default=0),
+        ),
+        migrations.AlterField(
+            model_name="podcast",
+            name="updated_at",
+            field=models.DateTimeField(auto_now=True),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 6.0 on 2026-10-19 18:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("limpa", "0013_changesequence"),
+    ]
+
+    operations = [
+        migrations.DeleteModel(
+            name="ChangeSequence",
+        ),
+        migrations.AlterField(
+            model_name="podcast",
+            name="change_seq",
+            field=models.BigIntegerField(default=0),
+        ),
+    ]
@@ -1,12 +1,31 @@
 import hashlib
 from typing import TYPE_CHECKING, ClassVar
 
-from django.db import models
+from django.db import IntegrityError, models, transaction
+from django.db.models import F
+from django.utils import timezone
 
 if TYPE_CHECKING:
+    from datetime import timedelta
+
     from django.db.models import Manager
 
 
+# Everything a podcast card renders. Writes to any of them bump `change_seq`.
+CARD_FIELDS = [
+    "title",
+    "url",
+    "url_hash",
+    "status",
+    "episode_count",
+    "last_refreshed_at",
+    "processed_episode_count",
+    "ads_removed_count",
+    "seconds_removed",
+    "error",
+]
+
+
 class Podcast(models.Model):
     objects: ClassVar[Manager]
 
@@ -16,6 +35,13 @@ class Podcast(models.Model):
         READY = "ready"
         FAILED = "failed"
 
+    # How cleaned audio is written, see limpa.services.audio.OUTPUT_PROFILES
+    class OutputProfile(models.TextChoices):
+        COPY = "copy", "Copy original"
+        SPEECH_MP3 = "speech_mp3", "Spoken-word MP3 (64 kbps mono)"
+        AAC_MONO = "aac_mono", "AAC (48 kbps mono)"
+        OPUS = "opus", "Opus (24 kbps mono)"
+
     url = models.URLField(unique=True)
     url_hash = models.CharField(max_length=64)
     title = models.CharField(max_length=500)
@@ -24,10 +50,23 @@ class Podcast(models.Model):
         max_length=20, choices=Status.choices, default=Status.PENDING
     )
     created_at = models.DateTimeField(auto_now_add=True)
-    processed_episodes = models.JSONField(
-        default=dict
-    )  # {guid: {original_url, s3_url}}
+    updated_at = models.DateTimeField(auto_now=True)
+    # Counts changes to the card, so the status poll can tell which changed
+    change_seq = models.BigIntegerField(default=0)
     last_refreshed_at = models.DateTimeField(null=True, blank=True)
+    # Kept in step with READY episodes by `add_to_counters`, so listing and
+    # polling podcasts never has to touch the episode table
+    processed_episode_count = models.PositiveIntegerField(default=0)
+    ads_removed_count = models.PositiveIntegerField(default=0)
+    seconds_removed = models.FloatField(default=0)
+    # Median hours between recent episodes, learned on every run
+    publish_interval_hours = models.FloatField(null=True, blank=True)
+    next_refresh_at = models.DateTimeField(null=True, blank=True, db_index=True)
+    output_profile = models.CharField(
+        max_length=20, choices=OutputProfile.choices, default=OutputProfile.COPY
+    )
+    # Why the feed couldn't be added, shown on the card
+    error = models.CharField(max_length=500, blank=True)
 
     class Meta:
         ordering = ["-created_at"]
@@ -36,13 +75,185 @@ class Podcast(models.Model):
         return str(self.title)
 
     @property
-    def total_ads(self) -> int:
-        return sum(
-            len(ep.get("ads", {}).get("ads_list", []))
-            for ep in self.processed_episodes.values()
+    def minutes_removed(self) -> int:
+        return round(self.seconds_removed / 60)
+
+    def set_status(self, status: str, **fields) -> None:
+        """Write a status transition, and `fields`, leaving other columns alone."""
+        self.status = status
+        for name, value in fields.items():
+            setattr(self, name, value)
+        self.save(update_fields=["status", *fields])
+
+    def add_to_counters(
+        self, episodes: int = 0, ads: int = 0, seconds: float = 0.0
+    ) -> None:
+        """Atomically add to the stats counters without loading the row."""
+        Podcast.objects.filter(pk=self.pk).update(
+            processed_episode_count=F("processed_episode_count") + episodes,
+            ads_removed_count=F("ads_removed_count") + ads,
+            seconds_removed=F("seconds_removed") + seconds,
+            updated_at=timezone.now(),
+            change_seq=F("change_seq") + 1,
         )
 
     def save(self, *args, **kwargs):
         if not self.url_hash:
             self.url_hash = hashlib.sha256(str(self.url).encode()).hexdigest()
+        update_fields = kwargs.get("update_fields")
+        bump = not self._state.adding and (
+            update_fields is None or not set(update_fields).isdisjoint(CARD_FIELDS)
+        )
+        if update_fields is not None:
+            kwargs["update_fields"] = {
+                *update_fields,
+                "updated_at",
+                *(["change_seq"] if bump else []),
+            }
+        if bump:
+            self.change_seq = F("change_seq") + 1
         super().save(*args, **kwargs)
+        if bump:
+            self.refresh_from_db(fields=["change_seq"])
+
+
+class Episode(models.Model):
+    objects: ClassVar[Manager]
+
+    class Status(models.TextChoices):
+        PENDING = "pending"
+        PROCESSING = "processing"
+        READY = "ready"
+        FAILED = "failed"
+
+    podcast = models.ForeignKey(
+        Podcast, on_delete=models.CASCADE, related_name="episodes"
+    )
+    guid = models.CharField(max_length=1000)
+    title = models.CharField(max_length=1000)
+    original_url = models.URLField(max_length=2000)
+    s3_url = models.URLField(max_length=2000, blank=True)
+    transcript_url = models.URLField(max_length=2000, blank=True)
+    # sha256 of the original audio, which keys its objects in storage
+    audio_hash = models.CharField(max_length=64, blank=True, db_index=True)
+    # What `s3_url` holds, for the feed's enclosure
+    output_profile = models.CharField(max_length=20, blank=True)
+    audio_mime_type = models.CharField(max_length=100, blank=True)
+    audio_size = models.PositiveBigIntegerField(null=True, blank=True)
+    ads = models.JSONField(default=dict)  # AdvertisementData
+    status = models.CharField(
+        max_length=20, choices=Status.choices, default=Status.PENDING
+    )
+    published_at = models.DateTimeField(null=True, blank=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+    prompt_version = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["podcast", "guid"], name="unique_podcast_episode_guid"
+            )
+        ]
+        indexes = [
+            models.Index(fields=["status"]),
+            models.Index(fields=["published_at"]),
+        ]
+
+    def __str__(self) -> str:
+        return str(self.title)
+
+    @property
+    def ads_count(self) -> int:
+        return len(self.ads.get("ads_list", []))
+
+    @property
+    def ads_seconds(self) -> float:
+        return sum(
+            ad["end_timestamp_seconds"] - ad["start_timestamp_seconds"]
+            for ad in self.ads.get("ads_list", [])
+        )
+
+    def _counted(self) -> tuple[int, int, float]:
+        """What this episode adds to its podcast's counters."""
+        if self.status != self.Status.READY:
+            return 0, 0, 0.0
+        return 1, self.ads_count, self.ads_seconds
+
+    @classmethod
+    def upsert(cls, podcast: Podcast, guid: str, status: str, **fields) -> None:
+        """Insert or update one episode with a single statement.
+
+        The podcast counters get the difference from the row's previous state,
+        so re-processing an episode (or two workers racing on it) never counts
+        it twice.
+        """
+        with transaction.atomic():
+            previous = (
+                cls.objects.select_for_update()
+                .filter(podcast=podcast, guid=guid)
+                .only("status", "ads")
+                .first()
+            )
+            episode = cls(podcast=podcast, guid=guid, status=status, **fields)
+            cls.objects.bulk_create(
+                [episode],
+                update_conflicts=True,
+                unique_fields=["podcast", "guid"],
+                update_fields=["status", *fields],
+            )
+            before = previous._counted() if previous else (0, 0, 0.0)
+            after = episode._counted()
+            if before != after:
+                podcast.add_to_counters(
+                    episodes=after[0] - before[0],
+                    ads=after[1] - before[1],
+                    seconds=after[2] - before[2],
+                )
+
+
+class ProcessingLease(models.Model):
+    """A named, expiring claim on a piece of work, shared by all workers."""
+
+    objects: ClassVar[Manager]
+
+    key = models.CharField(max_length=255, unique=True)
+    owner = models.CharField(max_length=255)
+    expires_at = models.DateTimeField(db_index=True)
+
+    def __str__(self) -> str:
+        return str(self.key)
+
+    @classmethod
+    def acquire(cls, key: str, owner: str, ttl: timedelta) -> bool:
+        now = timezone.now()
+        # Take over an expired lease, or extend one this owner already holds
+        if (
+            cls.objects.filter(key=key)
+            .filter(models.Q(expires_at__lte=now) | models.Q(owner=owner))
+            .update(owner=owner, expires_at=now + ttl)
+        ):
+            return True
+        try:
+            with transaction.atomic():
+                cls.objects.create(key=key, owner=owner, expires_at=now + ttl)
+        except IntegrityError:
+            return False
+        return True
+
+    @classmethod
+    def renew(cls, keys: list[str], owner: str, ttl: timedelta) -> None:
+        cls.objects.filter(key__in=keys, owner=owner).update(
+            expires_at=timezone.now() + ttl
+        )
+
+    @classmethod
+    def release(cls, keys: list[str], owner: str) -> None:
+        cls.objects.filter(key__in=keys, owner=owner).delete()
+
+    @classmethod
+    def held(cls, keys: list[str]) -> set[str]:
+        return set(
+            cls.objects.filter(key__in=keys, expires_at__gt=timezone.now()).values_list(
+                "key", flat=True
+            )
+        )
@@ -0,0 +1,237 @@
+"""Per-podcast index of confirmed ad reads, used to pre-label recurring ads.
+
+Each confirmed ad is stored as a bottom-k MinHash sketch of its word
+shingles, together with where in the ad each sampled shingle occurs. A new
+transcript is scanned once, shingle by shingle, against an inverted index of
+all sketches. Sketches with enough hits are reported as matches, and the
+stored offsets are used to align the match to the ad's original start.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import heapq
+import json
+import re
+import statistics
+from collections import defaultdict
+from dataclasses import asdict, dataclass, field
+from typing import TYPE_CHECKING
+
+from .s3 import get_ad_index, get_episode_transcript, upload_ad_index
+from .transcripts import load_transcript
+from .types import AdvertisementData, AdvertisementItem
+
+if TYPE_CHECKING:
+    from collections.abc import Iterable
+
+    from limpa.models import Episode
+
+    from .types import TranscriptionResult
+
+SHINGLE_SIZE = 5
+SKETCH_SIZE = 64
+MAX_ADS = 200
+MIN_SHINGLES = 8
+DUPLICATE_SIMILARITY = 0.8
+
+_WORD_RE = re.compile(r"[a-z0-9']+")
+
+
+def _words_with_times(
+    transcription: TranscriptionResult,
+) -> tuple[list[str], list[float]]:
+    words: list[str] = []
+    times: list[float] = []
+    for seg in transcription.segments:
+        seg_words = _WORD_RE.findall(seg.text.lower())
+        step = (seg.end - seg.start) / max(len(seg_words), 1)
+        words.extend(seg_words)
+        times.extend(seg.start + i * step for i in range(len(seg_words)))
+    return words, times
+
+
+def _shingle_hashes(words: list[str]) -> list[int]:
+    return [
+        int.from_bytes(
+            hashlib.blake2b(
+                " ".join(words[i : i + SHINGLE_SIZE]).encode(), digest_size=8
+            ).digest()
+        )
+        for i in range(len(words) - SHINGLE_SIZE + 1)
+    ]
+
+
+@dataclass
+class IndexedAd:
+    summary: str
+    duration: float
+    hashes: list[int]
+    offsets: list[float]
+
+    def similarity(self, other: IndexedAd) -> float:
+        """Estimated Jaccard similarity of the two bottom-k sketches."""
+        ours, theirs = set(self.hashes), set(other.hashes)
+        union = heapq.nsmallest(SKETCH_SIZE, ours | theirs)
+        if not union:
+            return 0.0
+        return sum(1 for h in union if h in ours and h in theirs) / len(union)
+
+
+@dataclass
+class AdIndex:
+    ads: list[IndexedAd] = field(default_factory=list)
+    ads_per_episode: list[int] = field(default_factory=list)
+    max_episodes: int = 20
+
+    def __post_init__(self):
+        self._postings: dict[int, list[tuple[int, float]]] = defaultdict(list)
+        for ad_id, ad in enumerate(self.ads):
+            self._index(ad_id, ad)
+
+    def _index(self, ad_id: int, ad: IndexedAd) -> None:
+        for h, offset in zip(ad.hashes, ad.offsets):
+            self._postings[h].append((ad_id, offset))
+
+    @property
+    def expected_ads(self) -> float:
+        return statistics.median(self.ads_per_episode) if self.ads_per_episode else 0
+
+    def add_episode(
+        self,
+        transcription: TranscriptionResult,
+        ads: AdvertisementData,
+        min_containment: float = 0.5,
+    ) -> None:
+        """Index the confirmed `ads` of an episode.
+
+        Ads overlapping a span the index matches itself are skipped: they are
+        either indexed already or a false positive that shouldn't be
+        reinforced.
+        """
+        matched = self.match(transcription, min_containment=min_containment)
+        words, times = _words_with_times(transcription)
+        hashes = _shingle_hashes(words)
+        for ad in ads.ads_list:
+            start, end = ad.start_timestamp_seconds, ad.end_timestamp_seconds
+            if any(
+                start < known.end_timestamp_seconds
+                and end > known.start_timestamp_seconds
+                for known in matched.ads_list
+            ):
+                continue
+            in_ad = {
+                h: times[i] - start
+                for i, h in enumerate(hashes)
+                if start <= times[i] < end
+            }
+            if len(in_ad) < MIN_SHINGLES:
+                continue
+
+            sketch = heapq.nsmallest(SKETCH_SIZE, in_ad)
+            candidate = IndexedAd(
+                summary=ad.short_summary,
+                duration=end - start,
+                hashes=sketch,
+                offsets=[in_ad[h] for h in sketch],
+            )
+            if any(
+                candidate.similarity(existing) >= DUPLICATE_SIMILARITY
+                for existing in self.ads
+            ):
+                continue
+            self.ads.append(candidate)
+            self._index(len(self.ads) - 1, candidate)
+
+        if len(self.ads) > MAX_ADS:
+            self.ads = self.ads[-MAX_ADS:]
+            self.__post_init__()
+        self.ads_per_episode = [*self.ads_per_episode, len(ads.ads_list)][
+            -self.max_episodes :
+        ]
+
+    def match(
+        self, transcription: TranscriptionResult, min_containment: float = 0.5
+    ) -> AdvertisementData:
+        """Label spans of `transcription` that repeat an indexed ad."""
+        words, times = _words_with_times(transcription)
+        # ad_id -> [(sketch hash, estimated ad start in this transcript)]
+        hits: dict[int, list[tuple[int, float]]] = defaultdict(list)
+        for i, h in enumerate(_shingle_hashes(words)):
+            for ad_id, offset in self._postings.get(h, ()):
+                hits[ad_id].append((h, times[i] - offset))
+
+        found: list[AdvertisementItem] = []
+        for ad_id, ad_hits in hits.items():
+            ad = self.ads[ad_id]
+            # The same read can air more than once, so group hits by start
+            cluster: list[tuple[int, float]] = []
+            for h, start in sorted(ad_hits, key=lambda hit: hit[1]):
+                if cluster and start - cluster[0][1] > ad.duration / 2:
+                    found.extend(self._accept(ad, cluster, min_containment))
+                    cluster = []
+                cluster.append((h, start))
+            found.extend(self._accept(ad, cluster, min_containment))
+
+        return AdvertisementData(
+            ads_list=sorted(found, key=lambda a: a.start_timestamp_seconds)
+        )
+
+    @staticmethod
+    def _accept(
+        ad: IndexedAd, cluster: list[tuple[int, float]], min_containment: float
+    ) -> list[AdvertisementItem]:
+        if len({h for h, _ in cluster}) / len(ad.hashes) < min_containment:
+            return []
+        start = max(0.0, statistics.median(start for _, start in cluster))
+        return [
+            AdvertisementItem(
+                short_summary=ad.summary,
+                start_timestamp_seconds=start,
+                end_timestamp_seconds=start + ad.duration,
+            )
+        ]
+
+    def to_json(self) -> str:
+        return json.dumps(
+            {
+                "ads": [asdict(ad) for ad in self.ads],
+                "ads_per_episode": self.ads_per_episode,
+            }
+        )
+
+    @classmethod
+    def from_json(cls, data: str | bytes) -> AdIndex:
+        payload = json.loads(data)
+        return cls(
+            ads=[IndexedAd(**ad) for ad in payload["ads"]],
+            ads_per_episode=payload["ads_per_episode"],
+        )
+
+
+def load_ad_index(url_hash: str, bootstrap_episodes: Iterable[Episode]) -> AdIndex:
+    """Load a podcast's index, seeding it from `bootstrap_episodes` (their
+    stored transcripts and ads) on the first run."""
+    stored = get_ad_index(url_hash=url_hash)
+    if stored is not None:
+        return AdIndex.from_json(stored)
+
+    ad_index = AdIndex()
+    for episode in bootstrap_episodes:
+        transcript = get_episode_transcript(
+            url_hash=url_hash,
+            episode_guid=episode.guid,
+            audio_hash=episode.audio_hash,
+            transcript_url=episode.transcript_url,
+        )
+        if transcript is None or not episode.ads:
+            continue
+        ad_index.add_episode(
+            load_transcript(transcript),
+            AdvertisementData.model_validate(episode.ads),
+        )
+    return ad_index
+
+
+def save_ad_index(url_hash: str, ad_index: AdIndex) -> None:
+    upload_ad_index(url_hash=url_hash, index_json=ad_index.to_json())
@@ -0,0 +1,183 @@
+"""Resource-aware admission control for the episode pipeline.
+
+Before a run downloads anything it estimates how much disk and memory its
+episodes will need and reserves that. While the node is short on free disk
+or memory (after subtracting what other runs have reserved), this worker's RSS
+is too high, or the CPU run queue is too long, it is turned away with
+`NotAdmitted` and the task is queued again for later, so the worker and its
+leases are free in the meantime. Reservations live in the same node-wide store
+as the service limits, so all workers see them.
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import shutil
+import tempfile
+import uuid
+from dataclasses import dataclass
+from functools import cache
+from pathlib import Path
+
+from django.conf import settings
+
+from .limits import SharedState, new_slot, slot_alive
+
+logger = logging.getLogger(__name__)
+
+MB = 1024 * 1024
+ASSUMED_BITRATE = 128_000  # bits per second, when the duration is unknown
+# The input and the cut output are both on disk, with headroom for ffmpeg
+DISK_PER_INPUT_BYTE = 2.5
+# The downloaded bytes are held (and copied for pre-filtering and upload)
+# while the audio is also decoded to float32 PCM for VAD and fingerprinting
+MEMORY_PER_INPUT_BYTE = 3
+MEMORY_PER_SECOND = (16_000 + 8_000) * 4
+
+
+class NotAdmitted(Exception):
+    """The node has no room for the work yet."""
+
+
+@dataclass
+class Footprint:
+    disk_bytes: int = 0
+    memory_bytes: int = 0
+
+    def __add__(self, other: Footprint) -> Footprint:
+        return Footprint(
+            disk_bytes=self.disk_bytes + other.disk_bytes,
+            memory_bytes=self.memory_bytes + other.memory_bytes,
+        )
+
+
+def estimate_footprint(
+    content_length: int | None, duration_seconds: float | None, default_bytes: int
+) -> Footprint:
+    size = content_length or default_bytes
+    duration = duration_seconds or size * 8 / ASSUMED_BITRATE
+    return Footprint(
+        disk_bytes=int(size * DISK_PER_INPUT_BYTE),
+        memory_bytes=int(size * MEMORY_PER_INPUT_BYTE + duration * MEMORY_PER_SECOND),
+    )
+
+
+def _read_proc_kb(path: str, field: str) -> int | None:
+    try:
+        with Path(path).open() as f:
+            for line in f:
+                if line.startswith(f"{field}:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+def available_memory() -> int | None:
+    return _read_proc_kb("/proc/meminfo", "MemAvailable")
+
+
+def current_rss() -> int | None:
+    return _read_proc_kb("/proc/self/status", "VmRSS")
+
+
+class AdmissionController:
+    def __init__(
+        self,
+        state_dir: Path,
+        min_free_disk_mb: float,
+        min_free_memory_mb: float,
+        max_rss_mb: float,
+        max_load_per_cpu: float,
+        reservation_ttl_seconds: float,
+    ):
+        self.min_free_disk = min_free_disk_mb * MB
+        self.min_free_memory = min_free_memory_mb * MB
+        self.max_rss = max_rss_mb * MB
+        self.max_load_per_cpu = max_load_per_cpu
+        self.reservation_ttl_seconds = reservation_ttl_seconds
+        self.state = SharedState(
+            state_dir / "admission.json", default={"reservations": {}}
+        )
+
+    def _shortage(self, need: Footprint, reserved: Footprint) -> str | None:
+        free_disk = shutil.disk_usage(tempfile.gettempdir()).free
+        if free_disk - reserved.disk_bytes - need.disk_bytes < self.min_free_disk:
+            return f"free disk ({free_disk // MB} MB)"
+
+        memory = available_memory()
+        if (
+            memory is not None
+            and memory - reserved.memory_bytes - need.memory_bytes
+            < self.min_free_memory
+        ):
+            return f"available memory ({memory // MB} MB)"
+
+        rss = current_rss()
+        if rss is not None and rss + need.memory_bytes > self.max_rss:
+            return f"worker RSS ({rss // MB} MB)"
+
+        load = os.getloadavg()[0] / (os.cpu_count() or 1)
+        if load > self.max_load_per_cpu:
+            return f"CPU load ({load:.1f} per CPU)"
+        return None
+
+    def _try_admit(self, need: Footprint, force: bool) -> tuple[str | None, str | None]:
+        def change(state: dict, now: float) -> tuple[str | None, str | None]:
+            reservations = {
+                rid: r for rid, r in state["reservations"].items() if slot_alive(r, now)
+            }
+            state["reservations"] = reservations
+            reserved = sum(
+                (
+                    Footprint(r["disk_bytes"], r["memory_bytes"])
+                    for r in reservations.values()
+                ),
+                Footprint(),
+            )
+            shortage = self._shortage(need, reserved)
+            if shortage and not force:
+                return None, shortage
+
+            rid = uuid.uuid4().hex
+            reservations[rid] = new_slot(
+                self.reservation_ttl_seconds,
+                now,
+                disk_bytes=need.disk_bytes,
+                memory_bytes=need.memory_bytes,
+            )
+            return rid, shortage
+
+        return self.state.update(change)
+
+    def admit(self, need: Footprint, force: bool = False) -> str:
+        """Reserve `need` and return the reservation id.
+
+        Raises `NotAdmitted` if it doesn't fit, unless `force` is set for work
+        that has already been turned away for long enough.
+        """
+        rid, shortage = self._try_admit(need, force=force)
+        if rid is None:
+            logger.info(f"Deferring new work: low {shortage}")
+            raise NotAdmitted(shortage)
+        if shortage:
+            logger.warning(f"Admitted deferred work despite low {shortage}")
+        return rid
+
+    def release(self, rid: str) -> None:
+        self.state.update(lambda state, _: state["reservations"].pop(rid, None))
+
+
+@cache
+def get_admission_controller() -> AdmissionController | None:
+    if not settings.ADMISSION_ENABLED:
+        return None
+    return AdmissionController(
+        state_dir=Path(settings.LIMITS_DIR),
+        min_free_disk_mb=settings.ADMISSION_MIN_FREE_DISK_MB,
+        min_free_memory_mb=settings.ADMISSION_MIN_FREE_MEMORY_MB,
+        max_rss_mb=settings.ADMISSION_MAX_RSS_MB,
+        max_load_per_cpu=settings.ADMISSION_MAX_LOAD_PER_CPU,
+        reservation_ttl_seconds=settings.ADMISSION_RESERVATION_TTL_SECONDS,
+    )
@@ -1,21 +1,23 @@
 import logging
 import subprocess
 import tempfile
+from dataclasses import dataclass
 from pathlib import Path
 from typing import TYPE_CHECKING
 
+import numpy as np
+
 if TYPE_CHECKING:
     from .types import AdvertisementData
 
 logger = logging.getLogger(__name__)
 
 
-def remove_ads_from_audio(
-    input_path: Path, ads: AdvertisementData, output_path: Path | None = None
-) -> Path:
-    if not ads.ads_list:
-        logger.info("No ads to remove, returning original file")
-        return input_path
+def get_duration(source: Path | bytes) -> float:
+    if isinstance(source, bytes):
+        input_arg, input_bytes = "pipe:0", source
+    else:
+        input_arg, input_bytes = str(source), None
 
     duration_result = subprocess.run(
         [
@@ -26,34 +28,189 @@ def remove_ads_from_audio(
             "format=duration",
             "-of",
             "default=noprint_wrappers=1:nokey=1",
-            str(input_path),
+            input_arg,
         ],
+        input=input_bytes,
         capture_output=True,
-        text=True,
         check=True,
     )
-    total_duration = float(duration_result.stdout.strip())
+    return float(duration_result.stdout.decode().strip())
 
-    ad_segments = sorted(
-        [(ad.start_timestamp_seconds, ad.end_timestamp_seconds) for ad in ads.ads_list],
-        key=lambda x: x[0],
+
+def decode_pcm(audio_bytes: bytes, sample_rate: int = 16000) -> np.ndarray:
+    result = subprocess.run(
+        [
+            "ffmpeg",
+            "-v",
+            "error",
+            "-i",
+            "pipe:0",
+            "-f",
+            "s16le",
+            "-ac",
+            "1",
+            "-ar",
+            str(sample_rate),
+            "pipe:1",
+        ],
+        input=audio_bytes,
+        capture_output=True,
+        check=True,
     )
+    return np.frombuffer(result.stdout, dtype=np.int16).astype(np.float32) / 32768.0
 
-    keep_segments: list[tuple[float, float]] = []
-    current_pos = 0.0
 
-    for ad_start, ad_end in ad_segments:
-        if ad_start > current_pos:
-            keep_segments.append((current_pos, ad_start))
-        current_pos = max(current_pos, ad_end)
+def encode_pcm(
+    pcm: np.ndarray, sample_rate: int = 16000, bitrate: str = "64k"
+) -> bytes:
+    samples = (np.clip(pcm, -1.0, 1.0) * 32767).astype(np.int16)
+    result = subprocess.run(
+        [
+            "ffmpeg",
+            "-v",
+            "error",
+            "-f",
+            "s16le",
+            "-ac",
+            "1",
+            "-ar",
+            str(sample_rate),
+            "-i",
+            "pipe:0",
+            "-b:a",
+            bitrate,
+            "-f",
+            "mp3",
+            "pipe:1",
+        ],
+        input=samples.tobytes(),
+        capture_output=True,
+        check=True,
+    )
+    return result.stdout
 
-    if current_pos < total_duration:
-        keep_segments.append((current_pos, total_duration))
 
-    if not keep_segments:
-        logger.warning("No content left after removing ads")
-        return input_path
+@dataclass(frozen=True)
+class OutputProfile:
+    name: str
+    extension: str
+    mime_type: str
+    muxer: str
+    # ffmpeg encoder options; None copies the source's audio stream as is
+    codec_args: tuple[str, ...] | None
+
+
+# Spoken word stays intelligible at a fraction of a music bitrate, in mono.
+# Opus is the smallest, but not every podcast app plays it.
+OUTPUT_PROFILES = {
+    "copy": OutputProfile("copy", "mp3", "audio/mpeg", "mp3", None),
+    "speech_mp3": OutputProfile(
+        "speech_mp3",
+        "mp3",
+        "audio/mpeg",
+        "mp3",
+        ("-c:a", "libmp3lame", "-ac", "1", "-ar", "44100", "-b:a", "64k"),
+    ),
+    "aac_mono": OutputProfile(
+        "aac_mono",
+        "m4a",
+        "audio/mp4",
+        "ipod",
+        ("-c:a", "aac", "-ac", "1", "-b:a", "48k", "-movflags", "+faststart"),
+    ),
+    "opus": OutputProfile(
+        "opus",
+        "opus",
+        "audio/ogg",
+        "ogg",
+        ("-c:a", "libopus", "-ac", "1", "-b:a", "24k", "-application", "voip"),
+    ),
+}
 
+# Source codecs whose stream "copy" can cut without re-encoding, and the
+# container it is written to. Anything else is re-encoded as speech_mp3.
+COPY_PROFILES = {
+    "mp3": OUTPUT_PROFILES["copy"],
+    "aac": OutputProfile(
+        "copy", "m4a", "audio/mp4", "ipod", ("-c:a", "copy", "-movflags", "+faststart")
+    ),
+}
+
+
+def get_codec(source: Path) -> str:
+    result = subprocess.run(
+        [
+            "ffprobe",
+            "-v",
+            "error",
+            "-select_streams",
+            "a:0",
+            "-show_entries",
+            "stream=codec_name",
+            "-of",
+            "default=noprint_wrappers=1:nokey=1",
+            str(source),
+        ],
+        capture_output=True,
+        check=True,
+    )
+    return result.stdout.decode().strip()
+
+
+def _resolve_profile(input_path: Path, profile: OutputProfile) -> OutputProfile:
+    if profile.codec_args is not None:
+        return profile
+    codec = get_codec(input_path)
+    if codec in COPY_PROFILES:
+        return COPY_PROFILES[codec]
+    logger.info(f"Can't copy {codec} audio, re-encoding it as speech_mp3")
+    return OUTPUT_PROFILES["speech_mp3"]
+
+
+def _cut_by_copy(
+    input_path: Path,
+    keep_segments: list[tuple[float, float]],
+    profile: OutputProfile,
+    output_path: Path,
+) -> None:
+    """Join the kept segments without decoding, so cuts snap to the nearest
+    packet (~26 ms for MP3) and the audio keeps its original quality."""
+    quoted = str(input_path).replace("'", "'\\''")
+    with tempfile.NamedTemporaryFile("w", suffix=".txt", delete=False) as f:
+        for start, end in keep_segments:
+            f.write(f"file '{quoted}'\ninpoint {start}\noutpoint {end}\n")
+        concat_list = Path(f.name)
+    try:
+        subprocess.run(
+            [
+                "ffmpeg",
+                "-f",
+                "concat",
+                "-safe",
+                "0",
+                "-i",
+                str(concat_list),
+                "-map",
+                "0:a",
+                *(profile.codec_args or ("-c:a", "copy")),
+                "-f",
+                profile.muxer,
+                "-y",
+                str(output_path),
+            ],
+            capture_output=True,
+            check=True,
+        )
+    finally:
+        concat_list.unlink()
+
+
+def _cut_by_encoding(
+    input_path: Path,
+    keep_segments: list[tuple[float, float]],
+    profile: OutputProfile,
+    output_path: Path,
+) -> None:
     filter_parts = []
     for i, (start, end) in enumerate(keep_segments):
         filter_parts.append(
@@ -64,10 +221,6 @@ def remove_ads_from_audio(
     filter_parts.append(f"{concat_inputs}concat=n={len(keep_segments)}:v=0:a=1[outa]")
     filter_complex = "".join(filter_parts)
 
-    if output_path is None:
-        _, output_file = tempfile.mkstemp(suffix=".mp3")
-        output_path = Path(output_file)
-
     subprocess.run(
         [
             "ffmpeg",
@@ -77,6 +230,9 @@ def remove_ads_from_audio(
             filter_complex,
             "-map",
             "[outa]",
+            *(profile.codec_args or ()),
+            "-f",
+            profile.muxer,
             "-y",
             str(output_path),
         ],
@@ -84,8 +240,57 @@ def remove_ads_from_audio(
         check=True,
     )
 
+
+def remove_ads_from_audio(
+    input_path: Path,
+    ads: AdvertisementData,
+    profile: OutputProfile = OUTPUT_PROFILES["copy"],
+    output_path: Path | None = None,
+) -> tuple[Path, OutputProfile]:
+    """Cut `ads` out of the audio and write it with `profile`.
+
+    Returns the output and the profile it was written with, which for "copy"
+    depends on the source's codec.
+    """
+    profile = _resolve_profile(input_path, profile)
+    copying = profile.name == "copy"
+    if not ads.ads_list and copying:
+        logger.info("No ads to remove, returning original file")
+        return input_path, profile
+
+    total_duration = get_duration(input_path)
+
+    ad_segments = sorted(
+        [(ad.start_timestamp_seconds, ad.end_timestamp_seconds) for ad in ads.ads_list],
+        key=lambda x: x[0],
+    )
+
+    keep_segments: list[tuple[float, float]] = []
+    current_pos = 0.0
+
+    for ad_start, ad_end in ad_segments:
+        if ad_start > current_pos:
+            keep_segments.append((current_pos, ad_start))
+        current_pos = max(current_pos, ad_end)
+
+    if current_pos < total_duration:
+        keep_segments.append((current_pos, total_duration))
+
+    if not keep_segments:
+        logger.warning("No content left after removing ads, keeping the episode")
+        keep_segments = [(0.0, total_duration)]
+
+    if output_path is None:
+        _, output_file = tempfile.mkstemp(suffix=f".{profile.extension}")
+        output_path = Path(output_file)
+
+    if copying:
+        _cut_by_copy(input_path, keep_segments, profile, output_path)
+    else:
+        _cut_by_encoding(input_path, keep_segments, profile, output_path)
+
     total_ad_time = sum(end - start for start, end in ad_segments)
     logger.info(
-        f"Removed {len(ads.ads_list)} ads ({total_ad_time:.1f}s) from audio: {output_path}"  # noqa: E501
+        f"Removed {len(ads.ads_list)} ads ({total_ad_time:.1f}s) from audio as {profile.name}: {output_path}"  # noqa: E501
     )
-    return output_path
+    return output_path, profile
@@ -0,0 +1,83 @@
+"""Token-budgeted transcript rendering for the ad extraction prompt."""
+
+from __future__ import annotations
+
+import math
+from dataclasses import dataclass
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from .types import Segment, TranscriptionResult
+
+MIN_WORDS_PER_SEGMENT = 4
+
+
+def estimate_tokens(text: str) -> int:
+    # ~4 characters per token holds well enough for English BPE tokenizers
+    return math.ceil(len(text) / 4)
+
+
+@dataclass
+class CompactTranscript:
+    text: str
+    original_tokens: int
+    tokens: int
+    granularity_seconds: float
+    words_per_segment: int
+
+    @property
+    def saved_tokens(self) -> int:
+        return self.original_tokens - self.tokens
+
+
+def _merge_segments(
+    segments: list[Segment], granularity_seconds: float
+) -> list[tuple[float, list[str]]]:
+    merged: list[tuple[float, list[str]]] = []
+    for seg in segments:
+        if merged and seg.start - merged[-1][0] < granularity_seconds:
+            merged[-1][1].extend(seg.text.split())
+        else:
+            merged.append((seg.start, seg.text.split()))
+    return merged
+
+
+def _render(merged: list[tuple[float, list[str]]], words_per_segment: int) -> str:
+    return "\n".join(
+        f"[{start:.0f} secs] {' '.join(words[:words_per_segment])}"
+        for start, words in merged
+    )
+
+
+def compact_transcript(
+    transcription: TranscriptionResult,
+    granularity_seconds: float,
+    words_per_segment: int,
+    max_tokens: int,
+) -> CompactTranscript:
+    """Merge segments to `granularity_seconds`, keep the first
+    `words_per_segment` words of each and shrink both until the rendered
+    transcript fits in `max_tokens`."""
+    original_tokens = estimate_tokens(transcription.readable_segments())
+    duration = transcription.segments[-1].end if transcription.segments else 0.0
+
+    while True:
+        merged = _merge_segments(transcription.segments, granularity_seconds)
+        text = _render(merged, words_per_segment)
+        tokens = estimate_tokens(text)
+        if tokens <= max_tokens or (
+            words_per_segment <= MIN_WORDS_PER_SEGMENT
+            and granularity_seconds >= duration
+        ):
+            return CompactTranscript(
+                text=text,
+                original_tokens=original_tokens,
+                tokens=tokens,
+                granularity_seconds=granularity_seconds,
+                words_per_segment=words_per_segment,
+            )
+
+        if words_per_segment > MIN_WORDS_PER_SEGMENT:
+            words_per_segment = max(MIN_WORDS_PER_SEGMENT, words_per_segment * 3 // 4)
+        else:
+            granularity_seconds = max(granularity_seconds * 2, 1.0)
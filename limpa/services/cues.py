@@ -0,0 +1,49 @@
+"""Cheap local heuristics for spotting sponsor reads in a transcript."""
+
+from __future__ import annotations
+
+import re
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from .types import TranscriptionResult
+
+SPONSOR_CUES = re.compile(
+    r"\b("
+    r"brought to you by|sponsored by|today's sponsor|our sponsors?|"
+    r"support for (?:this|the) (?:show|podcast|episode)|"
+    r"promo code|discount code|use (?:the )?code|"
+    r"free trial|percent off|\d+% off|"
+    r"dot com slash|\.com/\w+|"
+    r"sign up (?:today|now)|head (?:over )?to \w+ dot com"
+    r")\b",
+    re.IGNORECASE,
+)
+
+
+def merge_spans(
+    spans: list[tuple[float, float]], gap_seconds: float = 0.0
+) -> list[tuple[float, float]]:
+    merged: list[tuple[float, float]] = []
+    for start, end in sorted(spans):
+        start = max(0.0, start)
+        if merged and start <= merged[-1][1] + gap_seconds:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def find_sponsor_cues(
+    transcription: TranscriptionResult, gap_seconds: float = 30.0
+) -> list[tuple[float, float]]:
+    """Return spans of segments containing sponsor phrases, merging cues that
+    are less than `gap_seconds` apart."""
+    return merge_spans(
+        [
+            (seg.start, seg.end)
+            for seg in transcription.segments
+            if SPONSOR_CUES.search(seg.text)
+        ],
+        gap_seconds=gap_seconds,
+    )
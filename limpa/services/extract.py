@@ -1,33 +1,49 @@
+from __future__ import annotations
+
+import asyncio
 import logging
-import os
-import time
 from functools import wraps
+from typing import TYPE_CHECKING
 
-from openai import APITimeoutError, OpenAI
+from django.conf import settings
 from pydantic import ValidationError
 
-from .types import AdvertisementData, TranscriptionResult
+from .compact import compact_transcript
+from .cues import find_sponsor_cues, merge_spans
+from .llm import get_llm_client
+from .types import (
+    AdvertisementData,
+    AdvertisementItem,
+    ScoredAdvertisementData,
+    TranscriptionResult,
+)
+
+if TYPE_CHECKING:
+    from collections.abc import Iterator
+
+    from .ad_index import AdIndex
 
 
 def retry_with_error_injection(max_attempts: int = 3):
     def decorator(func):
         @wraps(func)
-        def wrapper(*args, **kwargs):
+        async def wrapper(*args, **kwargs):
             error_msg = kwargs.get("error_msg")
             for attempt in range(max_attempts):
                 try:
                     kwargs["error_msg"] = error_msg
-                    return func(*args, **kwargs)
-                except (ValidationError, APITimeoutError) as e:
+                    return await func(*args, **kwargs)
+                # Timeouts and other transport errors are retried by the LLM
+                # client, so only invalid output is retried here
+                except ValidationError as e:
                     if attempt == max_attempts - 1:
                         logging.warning(f"Final attempt failed: {type(e).__name__}")
                         raise
-                    if isinstance(e, ValidationError):
-                        error_msg = str(e)
+                    error_msg = str(e)
                     logging.info(
                         f"Attempt {attempt + 1} failed with {type(e).__name__}, retrying..."  # noqa: E501
                     )
-                    time.sleep(2**attempt)
+                    await asyncio.sleep(2**attempt)
             return None
 
         return wrapper
@@ -35,16 +51,11 @@ def retry_with_error_injection(max_attempts: int = 3):
     return decorator
 
 
-@retry_with_error_injection(max_attempts=3)
-def extract_from_transcription(
-    transcription: TranscriptionResult | str,
-    error_msg: str | None = None,
-) -> AdvertisementData:
-    client = OpenAI(
-        base_url="https://openrouter.ai/api/v1",
-        api_key=os.environ["OPENROUTER_API_KEY"],
-    )
-    prompt = """
+# Bump whenever PROMPT or the extraction models change. It is stored with each
+# processed episode so `reprocess` can target episodes cleaned by older ones.
+PROMPT_VERSION = 1
+
+PROMPT = """
 You will be given a transcript of a podcast episode.
 
 The transcript is divided into segments, each with:
@@ -66,25 +77,304 @@ Important rules:
 - Exclude pure announcements, show intros, or personal reflections unless they directly support a promotion
 """  # noqa: E501
 
+CONFIDENCE_PROMPT = """
+For each ad, also give a confidence between 0 and 1 that the segment is an ad and that its boundaries are right.
+Use a low confidence when the segment is ambiguous or when you are unsure where it starts or ends.
+"""  # noqa: E501
+
+
+def _build_input(
+    transcription: TranscriptionResult | str, error_msg: str | None, scored: bool
+) -> list[dict[str, str]]:
+    prompt = PROMPT + CONFIDENCE_PROMPT if scored else PROMPT
+
     if error_msg:
         prompt += f"\n\nYou previously failed with the following error: {error_msg}"
 
-    user_msg = (
-        transcription.readable_segments()
-        if isinstance(transcription, TranscriptionResult)
-        else transcription
-    )
+    if isinstance(transcription, TranscriptionResult):
+        compacted = compact_transcript(
+            transcription,
+            granularity_seconds=settings.PROMPT_SEGMENT_GRANULARITY_SECONDS,
+            words_per_segment=settings.PROMPT_WORDS_PER_SEGMENT,
+            max_tokens=settings.PROMPT_MAX_TRANSCRIPT_TOKENS,
+        )
+        logging.info(
+            f"Compacted transcript to ~{compacted.tokens} tokens "
+            f"(saved ~{compacted.saved_tokens} tokens)"
+        )
+        user_msg = compacted.text
+    else:
+        user_msg = transcription
+
+    return [
+        {"role": "system", "content": prompt},
+        {"role": "user", "content": user_msg},
+    ]
 
-    response = client.responses.parse(
-        model="deepseek/deepseek-v3.2:nitro",
-        input=[
-            {"role": "system", "content": prompt},
-            {"role": "user", "content": user_msg},
-        ],
+
+@retry_with_error_injection(max_attempts=3)
+async def aextract_from_transcription(
+    transcription: TranscriptionResult | str,
+    error_msg: str | None = None,
+) -> AdvertisementData:
+    response = await get_llm_client().parse(
+        model=settings.AD_EXTRACTION_MODEL,
+        input=_build_input(transcription, error_msg, scored=False),
         text_format=AdvertisementData,
         temperature=0.0,
-        extra_body={"models": ["google/gemini-2.5-flash-lite", "openai/gpt-5-nano"]},
+        extra_body={"models": settings.AD_EXTRACTION_FALLBACK_MODELS},
     )
 
     assert isinstance(response.output_parsed, AdvertisementData)
     return response.output_parsed
+
+
+@retry_with_error_injection(max_attempts=3)
+async def aextract_scored(
+    transcription: TranscriptionResult | str,
+    error_msg: str | None = None,
+) -> ScoredAdvertisementData:
+    response = await get_llm_client().parse(
+        model=settings.AD_EXTRACTION_CHEAP_MODEL,
+        input=_build_input(transcription, error_msg, scored=True),
+        text_format=ScoredAdvertisementData,
+        temperature=0.0,
+    )
+
+    assert isinstance(response.output_parsed, ScoredAdvertisementData)
+    return response.output_parsed
+
+
+def extract_from_transcription(
+    transcription: TranscriptionResult | str,
+) -> AdvertisementData:
+    return get_llm_client().run(aextract_from_transcription(transcription))
+
+
+def _slice_transcription(
+    transcription: TranscriptionResult, start: float, end: float
+) -> TranscriptionResult:
+    segments = [
+        seg for seg in transcription.segments if seg.end > start and seg.start < end
+    ]
+    return TranscriptionResult(
+        text=" ".join(seg.text for seg in segments), segments=segments
+    )
+
+
+def split_into_windows(
+    transcription: TranscriptionResult, window_seconds: float, overlap_seconds: float
+) -> list[TranscriptionResult]:
+    if not transcription.segments:
+        return [transcription]
+
+    step = window_seconds - overlap_seconds
+    if step <= 0:
+        raise ValueError("Window overlap must be shorter than the window")
+
+    end_of_episode = transcription.segments[-1].end
+    windows = []
+    window_start = 0.0
+    while True:
+        window_end = window_start + window_seconds
+        window = _slice_transcription(transcription, window_start, window_end)
+        if window.segments:
+            windows.append(window)
+        if window_end >= end_of_episode:
+            return windows
+        window_start += step
+
+
+def merge_ads(
+    ads: list[AdvertisementItem], tolerance_seconds: float = 0.0
+) -> AdvertisementData:
+    merged: list[AdvertisementItem] = []
+    for ad in sorted(ads, key=lambda a: a.start_timestamp_seconds):
+        previous = merged[-1] if merged else None
+        if (
+            previous is None
+            or ad.start_timestamp_seconds
+            > previous.end_timestamp_seconds + tolerance_seconds
+        ):
+            merged.append(ad.model_copy())
+            continue
+
+        previous_length = (
+            previous.end_timestamp_seconds - previous.start_timestamp_seconds
+        )
+        ad_length = ad.end_timestamp_seconds - ad.start_timestamp_seconds
+        if ad_length > previous_length:
+            previous.short_summary = ad.short_summary
+        previous.end_timestamp_seconds = max(
+            previous.end_timestamp_seconds, ad.end_timestamp_seconds
+        )
+    return AdvertisementData(ads_list=merged)
+
+
+async def aextract_cascade(transcription: TranscriptionResult) -> AdvertisementData:
+    """Run the cheap model first and escalate only what it is unsure about.
+
+    Ads below AD_EXTRACTION_CONFIDENCE_THRESHOLD, and sponsor cues the cheap
+    model found no ad for, are re-extracted by the main model with
+    AD_EXTRACTION_ESCALATION_PADDING_SECONDS of context on each side.
+    """
+    threshold = settings.AD_EXTRACTION_CONFIDENCE_THRESHOLD
+    padding = settings.AD_EXTRACTION_ESCALATION_PADDING_SECONDS
+
+    scored = await aextract_scored(transcription)
+    confident = [ad for ad in scored.ads_list if ad.confidence >= threshold]
+    ad_spans = [
+        (ad.start_timestamp_seconds, ad.end_timestamp_seconds) for ad in scored.ads_list
+    ]
+    disputed = [
+        (start, end)
+        for start, end in find_sponsor_cues(transcription)
+        if not any(start < ad_end and end > ad_start for ad_start, ad_end in ad_spans)
+    ]
+    uncertain = [
+        (ad.start_timestamp_seconds, ad.end_timestamp_seconds)
+        for ad in scored.ads_list
+        if ad.confidence < threshold
+    ]
+
+    escalate = merge_spans(
+        [(start - padding, end + padding) for start, end in uncertain + disputed]
+    )
+    logging.info(
+        f"Cheap model found {len(scored.ads_list)} ads ({len(confident)} confident), "
+        f"escalating {len(escalate)} windows"
+    )
+    if not escalate:
+        return merge_ads(
+            [AdvertisementItem(**ad.model_dump()) for ad in confident],
+            tolerance_seconds=settings.AD_EXTRACTION_MERGE_TOLERANCE_SECONDS,
+        )
+
+    results = await asyncio.gather(
+        *(
+            aextract_from_transcription(_slice_transcription(transcription, start, end))
+            for start, end in escalate
+        )
+    )
+    return merge_ads(
+        [AdvertisementItem(**ad.model_dump()) for ad in confident]
+        + [ad for result in results for ad in result.ads_list],
+        tolerance_seconds=settings.AD_EXTRACTION_MERGE_TOLERANCE_SECONDS,
+    )
+
+
+async def _aextract_window(transcription: TranscriptionResult) -> AdvertisementData:
+    if settings.AD_EXTRACTION_CASCADE:
+        return await aextract_cascade(transcription)
+    return await aextract_from_transcription(transcription)
+
+
+async def _aextract_llm(transcription: TranscriptionResult) -> AdvertisementData:
+    window_seconds = settings.AD_EXTRACTION_WINDOW_SECONDS
+    duration = transcription.segments[-1].end if transcription.segments else 0.0
+    if not window_seconds or duration <= window_seconds:
+        return await _aextract_window(transcription)
+
+    windows = split_into_windows(
+        transcription,
+        window_seconds=window_seconds,
+        overlap_seconds=settings.AD_EXTRACTION_WINDOW_OVERLAP_SECONDS,
+    )
+    logging.info(f"Extracting ads from {len(windows)} transcript windows")
+
+    results = await asyncio.gather(*(_aextract_window(window) for window in windows))
+    return merge_ads(
+        [ad for result in results for ad in result.ads_list],
+        tolerance_seconds=settings.AD_EXTRACTION_MERGE_TOLERANCE_SECONDS,
+    )
+
+
+def cue_coverage(
+    transcription: TranscriptionResult, ads: list[AdvertisementItem]
+) -> float:
+    """Share of the transcript's sponsor-cue time that falls inside `ads`."""
+    cues = find_sponsor_cues(transcription, gap_seconds=0)
+    total = sum(end - start for start, end in cues)
+    if not total:
+        return 1.0
+    spans = merge_spans(
+        [(ad.start_timestamp_seconds, ad.end_timestamp_seconds) for ad in ads]
+    )
+    covered = sum(
+        max(0.0, min(cue_end, ad_end) - max(cue_start, ad_start))
+        for cue_start, cue_end in cues
+        for ad_start, ad_end in spans
+    )
+    return covered / total
+
+
+async def aextract_ads(
+    transcription: TranscriptionResult, ad_index: AdIndex | None = None
+) -> AdvertisementData:
+    known = (
+        ad_index.match(transcription, min_containment=settings.AD_INDEX_MIN_CONTAINMENT)
+        if ad_index
+        else AdvertisementData(ads_list=[])
+    )
+    if not known.ads_list:
+        return await _aextract_llm(transcription)
+
+    assert ad_index is not None
+    # The usual number of ads isn't enough on its own: a new sponsor next to
+    # the known ones would ship, so every sponsor cue must be accounted for
+    expected = ad_index.expected_ads
+    coverage = cue_coverage(transcription, known.ads_list)
+    if (
+        expected
+        and len(known.ads_list) >= expected
+        and coverage >= settings.AD_INDEX_SKIP_LLM_COVERAGE
+    ):
+        logging.info(
+            f"Recurring-ad index matched {len(known.ads_list)} ads covering "
+            f"{coverage:.0%} of sponsor cues, skipping the LLM"
+        )
+        return merge_ads(known.ads_list)
+
+    segments = [
+        seg
+        for seg in transcription.segments
+        if not any(
+            seg.start < ad.end_timestamp_seconds
+            and seg.end > ad.start_timestamp_seconds
+            for ad in known.ads_list
+        )
+    ]
+    if not segments:
+        logging.info(
+            f"Recurring-ad index matched {len(known.ads_list)} ads covering every "
+            "segment, skipping the LLM"
+        )
+        return merge_ads(known.ads_list)
+
+    remainder = TranscriptionResult(
+        text=" ".join(seg.text for seg in segments), segments=segments
+    )
+    logging.info(
+        f"Recurring-ad index matched {len(known.ads_list)} ads, sending "
+        f"{len(segments)}/{len(transcription.segments)} segments to the LLM"
+    )
+    extracted = await _aextract_llm(remainder)
+    return merge_ads(
+        known.ads_list + extracted.ads_list,
+        tolerance_seconds=settings.AD_EXTRACTION_MERGE_TOLERANCE_SECONDS,
+    )
+
+
+def extract_ads(
+    transcription: TranscriptionResult, ad_index: AdIndex | None = None
+) -> AdvertisementData:
+    return get_llm_client().run(aextract_ads(transcription, ad_index=ad_index))
+
+
+def extract_ads_batch(
+    transcriptions: list[TranscriptionResult], ad_index: AdIndex | None = None
+) -> Iterator[tuple[int, AdvertisementData]]:
+    """Yield `(index, ads)` for each transcription as soon as it finishes."""
+    return get_llm_client().as_completed(
+        aextract_ads(tr, ad_index=ad_index) for tr in transcriptions
+    )
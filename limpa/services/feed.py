@@ -1,19 +1,42 @@
+from __future__ import annotations
+
+import heapq
 import logging
 import re
+import xml.etree.ElementTree as ET
 from dataclasses import dataclass
+from datetime import UTC, datetime
+from email.utils import parsedate_to_datetime
+from typing import TYPE_CHECKING
 
 import feedparser
+from django.conf import settings
 
-from limpa.services.http import get_with_retry
+from limpa.services.http import get_with_retry, get_within, iter_with_retry
 from limpa.services.s3 import upload_feed_xml
 
+if TYPE_CHECKING:
+    from collections.abc import Callable, Iterable, Iterator
+
+    from limpa.models import Episode
+
 logger = logging.getLogger(__name__)
 
+CHUNK_SIZE = 64 * 1024
+ATOM = "{http://www.w3.org/2005/Atom}"
+ATOM_LINK, ATOM_TITLE, ATOM_ID = f"{ATOM}link", f"{ATOM}title", f"{ATOM}id"
+ATOM_PUBLISHED, ATOM_UPDATED = f"{ATOM}published", f"{ATOM}updated"
+ITUNES_DURATION = "{http://www.itunes.com/dtds/podcast-1.0.dtd}duration"
+
 
 class FeedError(Exception):
     pass
 
 
+class _NotStreamable(Exception):
+    """A feed format `_stream_feed` doesn't read, left to feedparser."""
+
+
 @dataclass
 class FeedData:
     title: str
@@ -22,18 +45,171 @@ class FeedData:
 
 
 @dataclass
-class Episode:
+class FeedEpisode:
     guid: str
     url: str
     title: str
+    published_at: datetime | None = None
+    duration_seconds: float | None = None
+
+
+def _parse_duration(value: str | None) -> float | None:
+    """Seconds from an itunes:duration of "SS", "MM:SS" or "HH:MM:SS"."""
+    if not value:
+        return None
+    seconds = 0.0
+    try:
+        for part in value.strip().split(":"):
+            seconds = seconds * 60 + float(part)
+    except ValueError:
+        return None
+    return seconds
+
+
+def _local_name(tag: str) -> str:
+    return tag.rpartition("}")[2]
+
+
+def _parse_date(value: str | None) -> datetime | None:
+    """RSS pubDate (RFC 822) or Atom (ISO 8601) date, in UTC."""
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        parsed = parsedate_to_datetime(value)
+    except ValueError:
+        try:
+            parsed = datetime.fromisoformat(value)
+        except ValueError:
+            return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=UTC)
+    return parsed.astimezone(UTC).replace(microsecond=0)
+
+
+def _text(element: ET.Element) -> str:
+    return (element.text or "").strip()
+
+
+def _item_episode(item: ET.Element) -> FeedEpisode | None:
+    """The fields Limpa uses from an RSS item or Atom entry, if it has audio."""
+    url = guid = title = published = updated = duration = None
+    for child in item:
+        tag = child.tag
+        if url is None and tag == "enclosure":
+            url = child.get("url")
+        elif url is None and tag == ATOM_LINK:
+            if child.get("rel") == "enclosure" or child.get("type", "").startswith(
+                "audio/"
+            ):
+                url = child.get("href")
+        elif title is None and tag in ("title", ATOM_TITLE):
+            title = _text(child)
+        elif guid is None and tag in ("guid", ATOM_ID):
+            guid = _text(child)
+        elif published is None and tag in ("pubDate", ATOM_PUBLISHED):
+            published = _text(child)
+        elif updated is None and tag == ATOM_UPDATED:
+            updated = _text(child)
+        elif duration is None and tag == ITUNES_DURATION:
+            duration = _text(child)
+    if not url:
+        return None
+    return FeedEpisode(
+        guid=guid or url,
+        url=url,
+        title=title or "Untitled Episode",
+        # Many Atom feeds only date entries by when they last changed
+        published_at=_parse_date(published or updated),
+        duration_seconds=_parse_duration(duration),
+    )
+
+
+def _stream_feed(
+    chunks: Iterable[bytes],
+) -> Iterator[tuple[str, str | FeedEpisode | None]]:
+    """Parse a feed incrementally, yielding ("title", feed title) and
+    ("item", episode or None) as each one is complete.
+
+    Items are dropped from the tree once read, so memory stays bounded by the
+    largest item rather than the feed. Raises `ET.ParseError` on malformed XML
+    and `_NotStreamable` on RSS 1.0 (RDF) feeds.
+    """
+    parser = ET.XMLPullParser(events=("start", "end"))
+
+    def events() -> Iterator[tuple[str, ET.Element]]:
+        for chunk in chunks:
+            parser.feed(chunk)
+            yield from parser.read_events()  # type: ignore[misc]
+        # Closing flushes what the parser held back at the end of the input,
+        # which can be the last item
+        parser.close()
+        yield from parser.read_events()  # type: ignore[misc]
+
+    path: list[ET.Element] = []
+    for event, element in events():
+        if event == "start":
+            if not path and _local_name(element.tag) == "RDF":
+                raise _NotStreamable("RSS 1.0")
+            path.append(element)
+            continue
+        path.pop()
+        name = _local_name(element.tag)
+        parent = _local_name(path[-1].tag) if path else ""
+        if name in ("item", "entry") and parent in ("channel", "feed"):
+            yield "item", _item_episode(element)
+            path[-1].remove(element)
+        elif name == "title" and parent in ("channel", "feed"):
+            yield "title", _text(element)
+
+
+def _chunks(data: bytes) -> Iterator[bytes]:
+    view = memoryview(data)
+    for start in range(0, len(data), CHUNK_SIZE):
+        yield bytes(view[start : start + CHUNK_SIZE])
+
+
+def _count_items(raw_xml: bytes) -> int:
+    # Counted on the raw bytes, so validation doesn't have to parse them all
+    return raw_xml.count(b"</item>") + raw_xml.count(b"</entry>")
 
 
 def fetch_and_validate_feed(url: str) -> FeedData:
+    """Fetch and check a newly added feed, within the validation budget."""
     try:
-        raw_xml = get_with_retry(url)
+        raw_xml = get_within(
+            url,
+            timeout=settings.FEED_VALIDATION_TIMEOUT,
+            max_bytes=settings.FEED_VALIDATION_MAX_BYTES,
+        )
     except Exception as e:
         raise FeedError(f"Failed to fetch feed: {e}") from e
 
+    title = ""
+    playable = False
+    try:
+        # Stops parsing as soon as the feed has a title and something to play
+        for kind, value in _stream_feed(_chunks(raw_xml)):
+            if kind == "title" and not title:
+                title = value  # type: ignore[assignment]
+            elif kind == "item" and value is not None:
+                playable = True
+            if title and playable:
+                break
+    except (ET.ParseError, _NotStreamable) as e:
+        logger.info(f"Feed {url} can't be streamed ({e}), parsing it leniently")
+        return _validate_with_feedparser(raw_xml)
+
+    if not title:
+        raise FeedError("Feed has no title")
+
+    if not playable:
+        raise FeedError("Feed has no episodes")
+
+    return FeedData(title=title, raw_xml=raw_xml, episode_count=_count_items(raw_xml))
+
+
+def _validate_with_feedparser(raw_xml: bytes) -> FeedData:
     parsed = feedparser.parse(raw_xml)
 
     if parsed.bozo and not parsed.entries:
@@ -49,14 +225,51 @@ def fetch_and_validate_feed(url: str) -> FeedData:
     return FeedData(title=title, raw_xml=raw_xml, episode_count=len(parsed.entries))
 
 
-def get_latest_episodes(url: str, count: int) -> list[Episode]:
-    raw_xml = get_with_retry(url)
+def get_latest_episodes(url: str, count: int) -> list[FeedEpisode]:
+    """The `count` most recent playable episodes, newest first.
 
+    The feed is parsed as it downloads and only a heap of the `count` newest
+    items is kept. Undated items rank below dated ones, and ties keep feed
+    order.
+    """
+    if count <= 0:
+        return []
+    try:
+        heap: list[tuple[float, int, FeedEpisode]] = []
+        playable = (
+            episode
+            for kind, episode in _stream_feed(iter_with_retry(url))
+            if kind == "item" and episode is not None
+        )
+        for position, episode in enumerate(playable):
+            published = episode.published_at
+            entry = (
+                published.timestamp() if published else float("-inf"),
+                -position,
+                episode,
+            )
+            if len(heap) < count:
+                heapq.heappush(heap, entry)
+            elif entry[:2] > heap[0][:2]:
+                heapq.heapreplace(heap, entry)
+    except (ET.ParseError, _NotStreamable) as e:
+        logger.info(f"Feed {url} can't be streamed ({e}), parsing it leniently")
+        return _latest_with_feedparser(get_with_retry(url), count)
+
+    return [episode for *_, episode in sorted(heap, key=lambda e: e[:2], reverse=True)]
+
+
+def _entry_date(entry) -> tuple | None:
+    # RSS 1.0 dc:date and Atom-only updated dates are parsed as "updated"
+    return entry.get("published_parsed") or entry.get("updated_parsed")
+
+
+def _latest_with_feedparser(raw_xml: bytes, count: int) -> list[FeedEpisode]:
     parsed = feedparser.parse(raw_xml)
 
     sorted_entries = sorted(
         parsed.entries,
-        key=lambda e: e.get("published_parsed") or (1970, 1, 1, 0, 0, 0, 0, 0, 0),
+        key=lambda e: _entry_date(e) or (1970, 1, 1, 0, 0, 0, 0, 0, 0),
         reverse=True,
     )
 
@@ -86,27 +299,87 @@ def get_latest_episodes(url: str, count: int) -> list[Episode]:
         title: str = entry.get("title", "Untitled Episode")  # type: ignore[union-attr]
         guid: str = entry.get("id") or entry.get("guid") or enclosure_url  # type: ignore[arg-type]
 
-        episodes.append(Episode(guid=guid, url=enclosure_url, title=title))
+        published = _entry_date(entry)
+        published_at = (
+            datetime(*published[:6], tzinfo=UTC)  # type: ignore[index]
+            if published
+            else None
+        )
+
+        episodes.append(
+            FeedEpisode(
+                guid=guid,
+                url=enclosure_url,
+                title=title,
+                published_at=published_at,
+                duration_seconds=_parse_duration(entry.get("itunes_duration")),  # type: ignore[arg-type]
+            )
+        )
 
     return episodes
 
 
+def _replace_enclosure(
+    xml_str: str,
+    original_url: str,
+    new_url: str,
+    mime_type: str = "",
+    length: int | None = None,
+) -> str:
+    original_url_escaped = original_url.replace("&", "&amp;")
+
+    def replace(match: re.Match[str]) -> str:
+        enclosure = f"{match[1]}{new_url}{match[2]}"
+        if mime_type:
+            enclosure = re.sub(
+                r"(\stype=)([\"'])[^\"']*\2", rf'\1"{mime_type}"', enclosure
+            )
+        if length is not None:
+            enclosure = re.sub(
+                r"(\slength=)([\"'])[^\"']*\2", rf'\1"{length}"', enclosure
+            )
+        return enclosure
+
+    return re.sub(
+        rf'(<enclosure[^>]*url=["\']){re.escape(original_url_escaped)}(["\'][^>]*>)',
+        replace,
+        xml_str,
+    )
+
+
 def regenerate_feed(
-    url: str, url_hash: str, processed_episodes: dict, podcast_title: str
+    url: str,
+    url_hash: str,
+    episodes: Iterable[Episode],
+    podcast_title: str,
+    redirect_url: Callable[[Episode], str] | None = None,
 ) -> None:
+    """Point processed episodes at their ad-free audio.
+
+    Episodes without it are left alone, or with `redirect_url` (on-demand
+    mode) pointed at the URL it returns for them.
+    """
     raw_xml = get_with_retry(url)
 
     xml_str = raw_xml.decode("utf-8")
 
-    for _, data in processed_episodes.items():
-        original_url = data["original_url"]
-        original_url_escaped = original_url.replace("&", "&amp;")
-        original_title = data["title"]
-        s3_url = data["s3_url"]
-        xml_str = re.sub(
-            rf'(<enclosure[^>]*url=["\']){re.escape(original_url_escaped)}(["\'][^>]*>)',
-            rf"\g<1>{s3_url}\g<2>",
+    episode_count = 0
+    for episode in episodes:
+        if not episode.s3_url:
+            if redirect_url is not None:
+                xml_str = _replace_enclosure(
+                    xml_str, episode.original_url, redirect_url(episode)
+                )
+            continue
+
+        episode_count += 1
+        original_title = episode.title
+        xml_str = _replace_enclosure(
             xml_str,
+            episode.original_url,
+            episode.s3_url,
+            mime_type=episode.audio_mime_type,
+            length=episode.audio_size,
         )
         xml_str = re.sub(
             rf"(<item>.*?<title>(?:<!\[CDATA\[)?\s*){re.escape(original_title)}(\s*(?:\]\]>)?</title>.*?</item>)",
@@ -127,5 +400,5 @@ def regenerate_feed(
 
     upload_feed_xml(url_hash=url_hash, xml_content=xml_str.encode("utf-8"))
     logger.info(
-        f"Regenerated feed for {url_hash} with {len(processed_episodes)} processed episodes"  # noqa: E501
+        f"Regenerated feed for {url_hash} with {episode_count} processed episodes"  # noqa: E501
     )
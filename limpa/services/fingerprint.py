@@ -0,0 +1,332 @@
+"""Acoustic fingerprints for spotting repeated, pre-produced ad spots.
+
+Landmark hashing in the style of Shazam: spectral peaks are paired with a few
+later peaks, and each pair becomes a 32-bit hash of (f1, f2, dt) anchored at
+the first peak's frame. A known spot is found in a new episode when many of
+its hashes occur with the same time offset.
+"""
+
+from __future__ import annotations
+
+import io
+import json
+from dataclasses import dataclass
+
+import numpy as np
+
+from .audio import decode_pcm
+from .s3 import get_fingerprints, upload_fingerprints
+from .types import AdvertisementData, AdvertisementItem
+
+SAMPLE_RATE = 8000
+FFT_SIZE = 1024
+HOP = 256
+FRAMES_PER_SECOND = SAMPLE_RATE / HOP
+PEAK_NEIGHBORHOOD = (15, 15)  # frames, frequency bins
+PEAK_MIN_DB_ABOVE_MEDIAN = 10.0
+FAN_OUT = 5
+MAX_DT = 63  # frames, fits the 6 bits reserved for dt
+FRAMES_PER_CHUNK = 4096
+MAX_SPOT_SECONDS = 180.0
+MIN_MATCHES = 20
+# Share of a spot's hashes that must line up. A full replay of a spot keeps
+# about a fifth of its hashes even when it's shifted by half a hop, while a
+# shared jingle or a few seconds of a spot stay near a tenth.
+MIN_MATCH_RATIO = 0.15
+
+
+@dataclass
+class Fingerprint:
+    hashes: np.ndarray  # uint32
+    frames: np.ndarray  # int32, anchor frame of each hash
+
+    def between(self, start: float, end: float) -> Fingerprint:
+        """Hashes anchored in [start, end), re-based to frames from `start`."""
+        first, last = int(start * FRAMES_PER_SECOND), int(end * FRAMES_PER_SECOND)
+        mask = (self.frames >= first) & (self.frames < last)
+        return Fingerprint(hashes=self.hashes[mask], frames=self.frames[mask] - first)
+
+
+def _running_max(values: np.ndarray, width: int, axis: int) -> np.ndarray:
+    """Max over a centered window of `width` along `axis`, by shifted maxima."""
+    half = width // 2
+    pad = [(0, 0)] * values.ndim
+    pad[axis] = (half, half)
+    padded = np.pad(values, pad, mode="constant", constant_values=-np.inf)
+    result = np.take(padded, range(0, values.shape[axis]), axis=axis)
+    for shift in range(1, 2 * half + 1):
+        window = np.take(padded, range(shift, shift + values.shape[axis]), axis=axis)
+        np.maximum(result, window, out=result)
+    return result
+
+
+def _spectral_peaks(pcm: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    if len(pcm) < FFT_SIZE:
+        return np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.int32)
+
+    frames = np.lib.stride_tricks.sliding_window_view(pcm, FFT_SIZE)[::HOP]
+    window = np.hanning(FFT_SIZE).astype(np.float32)
+
+    peak_frames: list[np.ndarray] = []
+    peak_bins: list[np.ndarray] = []
+    # Chunks overlap by the peak neighborhood so no peak is lost at a border
+    margin = PEAK_NEIGHBORHOOD[0] // 2
+    for start in range(0, len(frames), FRAMES_PER_CHUNK):
+        lo, hi = (
+            max(0, start - margin),
+            min(len(frames), start + FRAMES_PER_CHUNK + margin),
+        )
+        spec = np.abs(np.fft.rfft(frames[lo:hi] * window, axis=1))
+        spec_db = 20 * np.log10(spec + 1e-10)
+
+        local_max = _running_max(
+            _running_max(spec_db, PEAK_NEIGHBORHOOD[0], axis=0),
+            PEAK_NEIGHBORHOOD[1],
+            axis=1,
+        )
+        floor = np.median(spec_db) + PEAK_MIN_DB_ABOVE_MEDIAN
+        t, f = np.nonzero((spec_db == local_max) & (spec_db > floor))
+        t = t + lo
+        keep = (t >= start) & (t < start + FRAMES_PER_CHUNK)
+        peak_frames.append(t[keep])
+        peak_bins.append(f[keep])
+
+    return (
+        np.concatenate(peak_frames).astype(np.int32),
+        np.concatenate(peak_bins).astype(np.int32),
+    )
+
+
+def fingerprint_pcm(pcm: np.ndarray) -> Fingerprint:
+    times, bins = _spectral_peaks(pcm)
+    order = np.lexsort((bins, times))
+    times, bins = times[order], bins[order]
+
+    hashes: list[np.ndarray] = []
+    anchors: list[np.ndarray] = []
+    for k in range(1, FAN_OUT + 1):
+        dt = times[k:] - times[:-k]
+        valid = (dt > 0) & (dt <= MAX_DT)
+        f1, f2 = bins[:-k][valid], bins[k:][valid]
+        # 13 bits per frequency bin (rfft of 1024 has 513 bins) and 6 bits of dt
+        hashes.append(
+            (f1.astype(np.uint32) << 19) | (f2.astype(np.uint32) << 6) | dt[valid]
+        )
+        anchors.append(times[:-k][valid])
+
+    if not hashes:
+        return Fingerprint(
+            hashes=np.zeros(0, dtype=np.uint32), frames=np.zeros(0, dtype=np.int32)
+        )
+    return Fingerprint(
+        hashes=np.concatenate(hashes).astype(np.uint32),
+        frames=np.concatenate(anchors).astype(np.int32),
+    )
+
+
+def fingerprint_audio(audio_bytes: bytes) -> Fingerprint:
+    return fingerprint_pcm(decode_pcm(audio_bytes, sample_rate=SAMPLE_RATE))
+
+
+class FingerprintStore:
+    """Fingerprints of known ad spots, flattened into sorted parallel arrays."""
+
+    def __init__(self, max_spots: int):
+        self.max_spots = max_spots
+        self.spots: list[dict] = []  # {"summary", "duration", "count"}
+        self._hashes = np.zeros(0, dtype=np.uint32)
+        self._offsets = np.zeros(0, dtype=np.int32)
+        self._spot_ids = np.zeros(0, dtype=np.int32)
+
+    def __len__(self) -> int:
+        return len(self.spots)
+
+    def _sort(self) -> None:
+        order = np.argsort(self._hashes, kind="stable")
+        self._hashes = self._hashes[order]
+        self._offsets = self._offsets[order]
+        self._spot_ids = self._spot_ids[order]
+
+    def add(self, spot: Fingerprint, summary: str, duration: float) -> None:
+        if len(spot.hashes) < MIN_MATCHES or duration > MAX_SPOT_SECONDS:
+            return
+        self.spots.append(
+            {"summary": summary, "duration": duration, "count": len(spot.hashes)}
+        )
+        spot_id = len(self.spots) - 1
+        self._hashes = np.concatenate([self._hashes, spot.hashes])
+        self._offsets = np.concatenate([self._offsets, spot.frames])
+        self._spot_ids = np.concatenate(
+            [self._spot_ids, np.full(len(spot.hashes), spot_id, dtype=np.int32)]
+        )
+        if len(self.spots) > self.max_spots:
+            self._drop_oldest(len(self.spots) - self.max_spots)
+        self._sort()
+
+    def _drop_oldest(self, n: int) -> None:
+        keep = self._spot_ids >= n
+        self.spots = self.spots[n:]
+        self._hashes = self._hashes[keep]
+        self._offsets = self._offsets[keep]
+        self._spot_ids = self._spot_ids[keep] - n
+
+    def contains(self, spot: Fingerprint) -> bool:
+        return any(
+            abs(match.start_timestamp_seconds) < 1.0 for match in self.match(spot)
+        )
+
+    def match(self, episode: Fingerprint) -> list[AdvertisementItem]:
+        if not len(self._hashes) or not len(episode.hashes):
+            return []
+
+        lo = np.searchsorted(self._hashes, episode.hashes, side="left")
+        hi = np.searchsorted(self._hashes, episode.hashes, side="right")
+        counts = hi - lo
+        if not counts.sum():
+            return []
+
+        # Expand every (episode hash, stored hash) pair without a Python loop
+        query = np.repeat(np.arange(len(episode.hashes)), counts)
+        stored = np.repeat(lo - np.cumsum(counts) + counts, counts) + np.arange(
+            counts.sum()
+        )
+        offsets = (episode.frames[query] - self._offsets[stored]).astype(np.int64)
+        pair_keys = self._spot_ids[stored].astype(np.int64) << 32 | (offsets + 2**31)
+        keys, votes = np.unique(pair_keys, return_counts=True)
+
+        # Episodes rarely line up with the hop, so peaks land a frame either
+        # way: count neighbouring offsets too and keep only the local maxima
+        def votes_at(targets: np.ndarray) -> np.ndarray:
+            idx = np.clip(np.searchsorted(keys, targets), 0, len(keys) - 1)
+            return np.where(keys[idx] == targets, votes[idx], 0)
+
+        below, above = votes_at(keys - 1), votes_at(keys + 1)
+        smoothed = votes + below + above
+        spot_ids = keys >> 32
+        spot_counts = np.array([spot["count"] for spot in self.spots])[spot_ids]
+        accepted = (
+            (smoothed >= MIN_MATCHES)
+            & (smoothed / spot_counts >= MIN_MATCH_RATIO)
+            & (votes >= below)
+            & (votes > above)
+        )
+
+        found: list[AdvertisementItem] = []
+        for key in keys[accepted].tolist():
+            spot_id = key >> 32
+            spot = self.spots[spot_id]
+            offset = (key & 0xFFFFFFFF) - 2**31
+            start, end = self._matched_extent(
+                spot_id, self._offsets[stored[np.abs(pair_keys - key) <= 1]]
+            )
+            found.append(
+                AdvertisementItem(
+                    short_summary=f"{spot['summary']} (known ad spot)",
+                    start_timestamp_seconds=max(
+                        0.0, (offset + start) / FRAMES_PER_SECOND
+                    ),
+                    end_timestamp_seconds=(offset + end) / FRAMES_PER_SECOND,
+                )
+            )
+        return sorted(found, key=lambda ad: ad.start_timestamp_seconds)
+
+    def _matched_extent(self, spot_id: int, frames: np.ndarray) -> tuple[float, float]:
+        """The part of a spot, in frames from its start, covered by the hashes
+        that matched. Only that part is cut, so audio that merely shares a
+        jingle or bed with the spot keeps the rest."""
+        spot_frames = self._offsets[self._spot_ids == spot_id]
+        first, last = int(frames.min()), int(frames.max())
+        # Peaks near the spot's edges pair with whatever audio surrounds it, so
+        # a match that gets within a pair's reach of an edge runs to that edge
+        start = 0.0 if first <= spot_frames.min() + MAX_DT else float(first)
+        if last >= spot_frames.max() - MAX_DT:
+            end = self.spots[spot_id]["duration"] * FRAMES_PER_SECOND
+        else:
+            end = float(last)
+        return start, end
+
+    def to_bytes(self) -> bytes:
+        buffer = io.BytesIO()
+        np.savez_compressed(
+            buffer,
+            hashes=self._hashes,
+            offsets=self._offsets,
+            spot_ids=self._spot_ids,
+            spots=np.frombuffer(json.dumps(self.spots).encode(), dtype=np.uint8),
+        )
+        return buffer.getvalue()
+
+    @classmethod
+    def from_bytes(cls, data: bytes, max_spots: int) -> FingerprintStore:
+        store = cls(max_spots=max_spots)
+        with np.load(io.BytesIO(data)) as arrays:
+            store._hashes = arrays["hashes"]
+            store._offsets = arrays["offsets"]
+            store._spot_ids = arrays["spot_ids"]
+            store.spots = json.loads(arrays["spots"].tobytes())
+        return store
+
+
+def load_fingerprint_store(url_hash: str | None, max_spots: int) -> FingerprintStore:
+    """Load a podcast's store, or the global one when `url_hash` is None."""
+    data = get_fingerprints(url_hash=url_hash)
+    if data is None:
+        return FingerprintStore(max_spots=max_spots)
+    return FingerprintStore.from_bytes(data, max_spots=max_spots)
+
+
+def save_fingerprint_store(url_hash: str | None, store: FingerprintStore) -> None:
+    upload_fingerprints(url_hash=url_hash, data=store.to_bytes())
+
+
+class AdSpotLibrary:
+    """A podcast's known ad spots, optionally backed by the global store.
+
+    Confirmed ads are fingerprinted into the podcast's store. With
+    `share_spots`, a spot that shows up again in the same podcast is taken to
+    be pre-produced audio rather than a live read and is promoted to the
+    global store, where every podcast (e.g. others on the same ad network) can
+    match it. Without it the global store is neither read nor written.
+
+    The stores are shared by every worker, so `reload`, `learn` and `save`
+    should run together while holding the stores' leases.
+    """
+
+    def __init__(
+        self, url_hash: str, max_spots: int, max_global_spots: int, share_spots: bool
+    ):
+        self.url_hash = url_hash
+        self.max_spots = max_spots
+        self.max_global_spots = max_global_spots
+        self.share_spots = share_spots
+        self.reload()
+
+    def reload(self) -> None:
+        self.podcast = load_fingerprint_store(self.url_hash, max_spots=self.max_spots)
+        self.shared = (
+            load_fingerprint_store(None, max_spots=self.max_global_spots)
+            if self.share_spots
+            else None
+        )
+        self._promoted = False
+
+    def match(self, episode: Fingerprint) -> list[AdvertisementItem]:
+        found = self.podcast.match(episode)
+        if self.shared is not None:
+            found += self.shared.match(episode)
+        return found
+
+    def learn(self, episode: Fingerprint, ads: AdvertisementData) -> None:
+        for ad in ads.ads_list:
+            start, end = ad.start_timestamp_seconds, ad.end_timestamp_seconds
+            spot = episode.between(start, end)
+            if not self.podcast.contains(spot):
+                self.podcast.add(spot, summary=ad.short_summary, duration=end - start)
+            elif self.shared is not None and not self.shared.contains(spot):
+                self.shared.add(spot, summary=ad.short_summary, duration=end - start)
+                self._promoted = True
+
+    def save(self) -> None:
+        save_fingerprint_store(self.url_hash, self.podcast)
+        if self._promoted:
+            save_fingerprint_store(None, self.shared)
@@ -1,14 +1,113 @@
+from __future__ import annotations
+
 import logging
+import time
+from contextlib import nullcontext
+from typing import TYPE_CHECKING
+from urllib.parse import urlparse
 from urllib.request import Request, urlopen
 
 from django.conf import settings
 from tenacity import retry, stop_after_attempt, wait_exponential
 
+from .limits import get_limiter
+
+if TYPE_CHECKING:
+    from collections.abc import Iterator
+    from contextlib import AbstractContextManager
+    from http.client import HTTPResponse
+
 logger = logging.getLogger(__name__)
 
 
+def _origin_slot(url: str) -> AbstractContextManager:
+    """A slot with `url`'s host in the origin limiter. URLs without a host
+    aren't limited."""
+    host = urlparse(url).hostname
+    if not host:
+        return nullcontext()
+    return get_limiter("origin", host=host).slot()
+
+
 @retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=1, max=10))
 def get_with_retry(url: str) -> bytes:
     req = Request(url, headers={"User-Agent": settings.REQUESTS_USER_AGENT})
-    with urlopen(req, timeout=settings.REQUESTS_TIMEOUT) as response:  # noqa: S310
+    with (
+        _origin_slot(url),
+        urlopen(req, timeout=settings.REQUESTS_TIMEOUT) as response,  # noqa: S310
+    ):
         return response.read()
+
+
+def _set_read_timeout(response: HTTPResponse, seconds: float) -> None:
+    # The socket under the response's buffered reader
+    sock = getattr(getattr(response.fp, "raw", None), "_sock", None)
+    if sock is not None:
+        sock.settimeout(seconds)
+
+
+def get_within(url: str, timeout: float, max_bytes: int) -> bytes:
+    """Fetch `url` in a single attempt, giving up after `timeout` seconds in
+    total or once the body is larger than `max_bytes`.
+
+    Each read waits on the socket only for what is left of the budget, and
+    `read1` makes at most one read from it, so a server sending slowly can't
+    stretch the total past `timeout`.
+    """
+    deadline = time.monotonic() + timeout
+    req = Request(url, headers={"User-Agent": settings.REQUESTS_USER_AGENT})
+    chunks: list[bytes] = []
+    size = 0
+    with (
+        _origin_slot(url),
+        urlopen(req, timeout=timeout) as response,  # noqa: S310
+    ):
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise TimeoutError(f"Response took longer than {timeout:g}s")
+            _set_read_timeout(response, remaining)
+            try:
+                chunk = response.read1(64 * 1024)
+            except TimeoutError as e:
+                raise TimeoutError(f"Response took longer than {timeout:g}s") from e
+            if not chunk:
+                break
+            size += len(chunk)
+            if size > max_bytes:
+                raise ValueError(f"Response is larger than {max_bytes} bytes")
+            chunks.append(chunk)
+    return b"".join(chunks)
+
+
+@retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=1, max=10))
+def _open_with_retry(url: str) -> HTTPResponse:
+    req = Request(url, headers={"User-Agent": settings.REQUESTS_USER_AGENT})
+    return urlopen(req, timeout=settings.REQUESTS_TIMEOUT)  # noqa: S310
+
+
+def iter_with_retry(url: str, chunk_size: int = 64 * 1024) -> Iterator[bytes]:
+    """Stream `url` in chunks. Only opening the connection is retried."""
+    with (
+        _origin_slot(url),
+        _open_with_retry(url) as response,
+    ):
+        while chunk := response.read(chunk_size):
+            yield chunk
+
+
+def get_content_length(url: str) -> int | None:
+    """Size announced for `url` by a HEAD request, if the server gives one."""
+    req = Request(
+        url, method="HEAD", headers={"User-Agent": settings.REQUESTS_USER_AGENT}
+    )
+    try:
+        with (
+            _origin_slot(url),
+            urlopen(req, timeout=settings.REQUESTS_TIMEOUT) as response,  # noqa: S310
+        ):
+            length = response.headers.get("Content-Length", "")
+    except OSError as e:
+        logger.info(f"HEAD request failed for {url}: {e}")
+        return None
+    return int(length) if length.isdigit() else None
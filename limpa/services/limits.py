@@ -0,0 +1,171 @@
+"""Rate limits and in-flight budgets shared by every worker process on a node.
+
+Each limited service (Modal, OpenRouter, S3 and every origin host that feeds
+and audio are downloaded from) has a small JSON state file with a token bucket
+and the slots currently in flight. Processes update it under an exclusive
+`flock`, so all `db_worker` processes draw from one budget. A slot records its
+holder's host and pid and an expiry, so slots of crashed processes are
+reclaimed instead of leaking.
+"""
+
+from __future__ import annotations
+
+import fcntl
+import json
+import logging
+import os
+import re
+import socket
+import time
+import uuid
+from contextlib import contextmanager
+from functools import cache, wraps
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+from django.conf import settings
+
+if TYPE_CHECKING:
+    from collections.abc import Callable, Iterator
+
+logger = logging.getLogger(__name__)
+
+POLL_SECONDS = 0.25
+HOSTNAME = socket.gethostname()
+
+
+def slot_alive(slot: dict, now: float) -> bool:
+    """Whether a slot's holder may still be using it."""
+    if slot["expires"] <= now:
+        return False
+    if slot["host"] != HOSTNAME:
+        return True
+    try:
+        os.kill(slot["pid"], 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def new_slot(ttl_seconds: float, now: float, **data) -> dict:
+    return {"host": HOSTNAME, "pid": os.getpid(), "expires": now + ttl_seconds, **data}
+
+
+class SharedState:
+    """A JSON document shared by the processes on a node, changed under `flock`."""
+
+    def __init__(self, path: Path, default: dict):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.path = path
+        self.default = default
+
+    def update[T](self, change: Callable[[dict, float], T]) -> T:
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            with os.fdopen(os.dup(fd), "r+") as f:
+                raw = f.read()
+                state = json.loads(raw) if raw else dict(self.default)
+                result = change(state, time.time())
+                f.seek(0)
+                f.truncate()
+                json.dump(state, f)
+            return result
+        finally:
+            os.close(fd)  # also releases the lock
+
+
+class ServiceLimiter:
+    def __init__(
+        self,
+        name: str,
+        state_dir: Path,
+        rate: float | None,
+        burst: int,
+        max_in_flight: int | None,
+        slot_ttl_seconds: float,
+    ):
+        self.name = name
+        self.rate = rate
+        self.burst = burst
+        self.max_in_flight = max_in_flight
+        self.slot_ttl_seconds = slot_ttl_seconds
+        self.state = SharedState(
+            state_dir / f"{name}.json",
+            default={"tokens": burst, "updated": time.time(), "slots": {}},
+        )
+
+    def _try_acquire(self, state: dict, now: float) -> tuple[str | None, float]:
+        state["slots"] = {
+            slot_id: slot
+            for slot_id, slot in state["slots"].items()
+            if slot_alive(slot, now)
+        }
+        if self.rate:
+            state["tokens"] = min(
+                self.burst, state["tokens"] + (now - state["updated"]) * self.rate
+            )
+            state["updated"] = now
+
+        if self.max_in_flight is not None and (
+            len(state["slots"]) >= self.max_in_flight
+        ):
+            return None, POLL_SECONDS
+        if self.rate and state["tokens"] < 1:
+            return None, (1 - state["tokens"]) / self.rate
+
+        if self.rate:
+            state["tokens"] -= 1
+        slot_id = uuid.uuid4().hex
+        state["slots"][slot_id] = new_slot(self.slot_ttl_seconds, now)
+        return slot_id, 0.0
+
+    def acquire(self) -> str:
+        """Block until a request may start, and return its slot id."""
+        waited = 0.0
+        while True:
+            slot_id, wait = self.state.update(self._try_acquire)
+            if slot_id is not None:
+                if waited >= 1:
+                    logger.info(f"Waited {waited:.1f}s for a {self.name} slot")
+                return slot_id
+            time.sleep(wait)
+            waited += wait
+
+    def release(self, slot_id: str) -> None:
+        self.state.update(lambda state, _: state["slots"].pop(slot_id, None))
+
+    @contextmanager
+    def slot(self) -> Iterator[None]:
+        slot_id = self.acquire()
+        try:
+            yield
+        finally:
+            self.release(slot_id)
+
+
+@cache
+def get_limiter(service: str, host: str | None = None) -> ServiceLimiter:
+    """The limiter for `service`, or for one `host` of the "origin" service."""
+    name = service
+    if host is not None:
+        name = f"{service}-{re.sub(r'[^a-z0-9.-]', '_', host.lower())}"
+    return ServiceLimiter(
+        name=name,
+        state_dir=Path(settings.LIMITS_DIR),
+        **settings.SERVICE_LIMITS[service],
+    )
+
+
+def limited[**P, T](service: str) -> Callable[[Callable[P, T]], Callable[P, T]]:
+    def decorator(func: Callable[P, T]) -> Callable[P, T]:
+        @wraps(func)
+        def wrapper(*args: P.args, **kwargs: P.kwargs) -> T:
+            with get_limiter(service).slot():
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,153 @@
+"""Process-wide async OpenRouter client.
+
+One `AsyncOpenAI` client (and so one keep-alive connection pool) is shared by
+every extraction in the process. It lives on a dedicated event loop thread so
+sync callers such as tasks and management commands can use it too. Requests
+are bounded by a semaphore, and a 429 pauses every request until the
+server's Retry-After has passed instead of letting each caller back off alone.
+Connection errors, timeouts and 5xx responses are retried per request with
+exponential backoff, as the SDK would.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import concurrent.futures
+import logging
+import os
+import threading
+from email.utils import parsedate_to_datetime
+from functools import cache
+from typing import TYPE_CHECKING, Any
+
+import httpx
+from django.conf import settings
+from django.utils import timezone
+from openai import (
+    APIConnectionError,
+    AsyncOpenAI,
+    InternalServerError,
+    RateLimitError,
+)
+
+from .limits import get_limiter
+
+if TYPE_CHECKING:
+    from collections.abc import Coroutine, Iterable, Iterator
+
+logger = logging.getLogger(__name__)
+
+OPENROUTER_BASE_URL = "https://openrouter.ai/api/v1"
+
+
+def _retry_after_seconds(response: httpx.Response) -> float | None:
+    value = response.headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except ValueError:
+        return None
+    return max(0.0, (retry_at - timezone.now()).total_seconds())
+
+
+class LLMClient:
+    def __init__(
+        self, max_concurrency: int, max_rate_limit_retries: int, max_retries: int
+    ):
+        self.max_concurrency = max_concurrency
+        self.max_rate_limit_retries = max_rate_limit_retries
+        self.max_retries = max_retries
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(
+            target=self._loop.run_forever, name="llm-client", daemon=True
+        )
+        self._thread.start()
+        self._client: AsyncOpenAI | None = None
+        self._semaphore: asyncio.Semaphore | None = None
+        self._resume_at = 0.0
+        self._limiter = get_limiter("openrouter")
+
+    def _get_client(self) -> tuple[AsyncOpenAI, asyncio.Semaphore]:
+        if self._client is None or self._semaphore is None:
+            self._client = AsyncOpenAI(
+                base_url=OPENROUTER_BASE_URL,
+                api_key=os.environ["OPENROUTER_API_KEY"],
+                # Retries are handled here so all requests back off together on 429s
+                max_retries=0,
+                http_client=httpx.AsyncClient(
+                    limits=httpx.Limits(
+                        max_connections=self.max_concurrency,
+                        max_keepalive_connections=self.max_concurrency,
+                        keepalive_expiry=120,
+                    ),
+                    timeout=httpx.Timeout(settings.LLM_REQUEST_TIMEOUT, connect=10),
+                ),
+            )
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._client, self._semaphore
+
+    async def _wait_for_rate_limit(self) -> None:
+        while (delay := self._resume_at - self._loop.time()) > 0:
+            await asyncio.sleep(delay)
+
+    async def parse(self, **kwargs: Any) -> Any:
+        client, semaphore = self._get_client()
+        attempt = 0
+        failures = 0
+        while True:
+            backoff = 0.0
+            await self._wait_for_rate_limit()
+            async with semaphore:
+                await self._wait_for_rate_limit()
+                # The node-wide budget, shared with the other worker processes
+                slot_id = await asyncio.to_thread(self._limiter.acquire)
+                try:
+                    return await client.responses.parse(**kwargs)
+                except RateLimitError as e:
+                    if attempt >= self.max_rate_limit_retries:
+                        raise
+                    delay = _retry_after_seconds(e.response) or 2**attempt
+                    self._resume_at = max(self._resume_at, self._loop.time() + delay)
+                    logger.info(f"Rate limited by OpenRouter, pausing for {delay:.1f}s")
+                    attempt += 1
+                # Includes timeouts, which subclass APIConnectionError
+                except (APIConnectionError, InternalServerError) as e:
+                    if failures >= self.max_retries:
+                        raise
+                    backoff = min(0.5 * 2**failures, 8.0)
+                    logger.info(
+                        f"OpenRouter request failed ({type(e).__name__}), "
+                        f"retrying in {backoff:.1f}s"
+                    )
+                    failures += 1
+                finally:
+                    await asyncio.to_thread(self._limiter.release, slot_id)
+            # Outside the semaphore, so other requests go ahead meanwhile
+            await asyncio.sleep(backoff)
+
+    def run[T](self, coro: Coroutine[Any, Any, T]) -> T:
+        return asyncio.run_coroutine_threadsafe(coro, self._loop).result()
+
+    def as_completed[T](
+        self, coros: Iterable[Coroutine[Any, Any, T]]
+    ) -> Iterator[tuple[int, T]]:
+        futures = {
+            asyncio.run_coroutine_threadsafe(coro, self._loop): i
+            for i, coro in enumerate(coros)
+        }
+        for future in concurrent.futures.as_completed(futures):
+            yield futures[future], future.result()
+
+
+@cache
+def get_llm_client() -> LLMClient:
+    return LLMClient(
+        max_concurrency=settings.LLM_MAX_CONCURRENCY,
+        max_rate_limit_retries=settings.LLM_MAX_RATE_LIMIT_RETRIES,
+        max_retries=settings.LLM_MAX_RETRIES,
+    )
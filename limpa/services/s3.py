@@ -6,9 +6,15 @@ from typing import TYPE_CHECKING
 
 import boto3
 
+from .limits import limited
+
 if TYPE_CHECKING:
+    from collections.abc import Container
+    from datetime import datetime
     from pathlib import Path
 
+    from .audio import OutputProfile
+
 
 def get_s3_client():
     return boto3.client(
@@ -20,6 +26,7 @@ def get_s3_client():
     )
 
 
+@limited("s3")
 def upload_feed_xml(url_hash: str, xml_content: bytes) -> bool:
     bucket = os.environ["AWS_S3_BUCKET_NAME"]
     key = f"{url_hash}/feed.xml"
@@ -34,6 +41,8 @@ def upload_feed_xml(url_hash: str, xml_content: bytes) -> bool:
     return True
 
 
+# Not limited: this serves podcast apps, which shouldn't queue behind the
+# workers' S3 traffic
 def get_feed_xml(url_hash: str) -> bytes | None:
     bucket = os.environ["AWS_S3_BUCKET_NAME"]
     key = f"{url_hash}/feed.xml"
@@ -46,12 +55,56 @@ def get_feed_xml(url_hash: str) -> bytes | None:
         return None
 
 
-def upload_episode_audio(url_hash: str, episode_guid: str, audio_path: Path) -> str:
-    bucket = os.environ["AWS_S3_BUCKET_NAME"]
+def audio_prefix(audio_hash: str) -> str:
+    """Where everything derived from one original audio file is stored.
+
+    Objects are keyed by the audio's content rather than by feed and guid, so
+    the same audio reached through several feeds is stored once.
+    """
+    return f"audio/{audio_hash}/"
+
+
+def object_key(url: str) -> str:
+    """The key of an object from the URL it is served at."""
+    prefix = os.environ["AWS_S3_BUCKET_URL_PREFIX"].rstrip("/")
+    return url.removeprefix(f"{prefix}/")
+
+
+def _transcript_key(audio_hash: str, url_hash: str) -> str:
+    return f"{audio_prefix(audio_hash)}transcripts/{url_hash}.bin"
+
+
+def _transcript_keys(url_hash: str, episode_guid: str, audio_hash: str) -> list[str]:
+    """Where a transcript may be, newest format first."""
+    if audio_hash:
+        prefix = audio_prefix(audio_hash)
+        return [
+            _transcript_key(audio_hash, url_hash),
+            # Shared by every feed, before transcripts were stored per podcast
+            f"{prefix}transcript.bin",
+            f"{prefix}transcript.json",
+        ]
+    # Episodes processed before content addressing have no audio hash
     guid_hash = hashlib.sha256(episode_guid.encode()).hexdigest()
+    return [f"{url_hash}/episodes/{guid_hash}_transcript.json"]
+
+
+@limited("s3")
+def upload_episode_audio(
+    audio_hash: str, version: int, audio_path: Path, profile: OutputProfile, cut: str
+) -> str:
+    """Upload cleaned audio, where `cut` identifies the spans removed.
+
+    Feeds sharing the audio share the object only if they cut the same ads,
+    so reprocessing one of them writes a new object instead of changing the
+    audio the others serve.
+    """
+    bucket = os.environ["AWS_S3_BUCKET_NAME"]
     prefix = os.environ["AWS_S3_BUCKET_URL_PREFIX"].rstrip("/")
 
-    key = f"{url_hash}/episodes/{guid_hash}.mp3"
+    key = (
+        f"{audio_prefix(audio_hash)}v{version}-{profile.name}-{cut}.{profile.extension}"
+    )
 
     client = get_s3_client()
     with audio_path.open("rb") as f:
@@ -59,27 +112,136 @@ def upload_episode_audio(url_hash: str, episode_guid: str, audio_path: Path) ->
             Bucket=bucket,
             Key=key,
             Body=f,
-            ContentType="audio/mpeg",
+            ContentType=profile.mime_type,
         )
 
-    return f"{prefix}/{url_hash}/episodes/{guid_hash}.mp3"
+    return f"{prefix}/{key}"
 
 
-def upload_episode_transcript(
-    url_hash: str, episode_guid: str, transcript_json: str
-) -> str:
+@limited("s3")
+def upload_episode_transcript(audio_hash: str, url_hash: str, transcript: bytes) -> str:
+    """Upload a transcript packed by `limpa.services.transcripts`.
+
+    Stored per podcast under the shared audio: transcription skips the
+    podcast's own known ad spots, so feeds with the same audio can differ.
+    """
     bucket = os.environ["AWS_S3_BUCKET_NAME"]
-    guid_hash = hashlib.sha256(episode_guid.encode()).hexdigest()
     prefix = os.environ["AWS_S3_BUCKET_URL_PREFIX"].rstrip("/")
 
-    key = f"{url_hash}/episodes/{guid_hash}_transcript.json"
+    key = _transcript_key(audio_hash, url_hash)
 
     client = get_s3_client()
     client.put_object(
         Bucket=bucket,
         Key=key,
-        Body=transcript_json.encode("utf-8"),
+        Body=transcript,
+        ContentType="application/octet-stream",
+    )
+
+    return f"{prefix}/{key}"
+
+
+@limited("s3")
+def get_episode_transcript(
+    url_hash: str, episode_guid: str, audio_hash: str = "", transcript_url: str = ""
+) -> bytes | None:
+    """Read the transcript at `transcript_url`, which may belong to another
+    feed the result was reused from, or else where this feed would store it."""
+    bucket = os.environ["AWS_S3_BUCKET_NAME"]
+
+    keys = _transcript_keys(url_hash, episode_guid, audio_hash)
+    if transcript_url:
+        keys.insert(0, object_key(transcript_url))
+
+    client = get_s3_client()
+    for key in keys:
+        try:
+            response = client.get_object(Bucket=bucket, Key=key)
+            return response["Body"].read()
+        except client.exceptions.NoSuchKey:
+            continue
+    return None
+
+
+@limited("s3")
+def delete_prefix(
+    prefix: str, keep: Container[str] = (), modified_before: datetime | None = None
+) -> int:
+    """Delete the objects under `prefix`, except the keys in `keep` and, if
+    `modified_before` is given, anything written since."""
+    bucket = os.environ["AWS_S3_BUCKET_NAME"]
+
+    client = get_s3_client()
+    deleted = 0
+    for page in client.get_paginator("list_objects_v2").paginate(
+        Bucket=bucket, Prefix=prefix
+    ):
+        keys = [
+            {"Key": obj["Key"]}
+            for obj in page.get("Contents", [])
+            if obj["Key"] not in keep
+            and (modified_before is None or obj["LastModified"] < modified_before)
+        ]
+        if keys:
+            # A listed page holds at most 1000 keys, the delete_objects limit
+            client.delete_objects(Bucket=bucket, Delete={"Objects": keys})
+            deleted += len(keys)
+    return deleted
+
+
+@limited("s3")
+def upload_ad_index(url_hash: str, index_json: str) -> bool:
+    bucket = os.environ["AWS_S3_BUCKET_NAME"]
+    key = f"{url_hash}/ad_index.json"
+
+    client = get_s3_client()
+    client.put_object(
+        Bucket=bucket,
+        Key=key,
+        Body=index_json.encode("utf-8"),
         ContentType="application/json",
     )
+    return True
+
+
+@limited("s3")
+def get_ad_index(url_hash: str) -> bytes | None:
+    bucket = os.environ["AWS_S3_BUCKET_NAME"]
+    key = f"{url_hash}/ad_index.json"
+
+    client = get_s3_client()
+    try:
+        response = client.get_object(Bucket=bucket, Key=key)
+        return response["Body"].read()
+    except client.exceptions.NoSuchKey:
+        return None
+
+
+def _fingerprints_key(url_hash: str | None) -> str:
+    return f"{url_hash}/ad_fingerprints.npz" if url_hash else "fingerprints.npz"
+
 
-    return f"{prefix}/{url_hash}/episodes/{guid_hash}_transcript.json"
+@limited("s3")
+def upload_fingerprints(url_hash: str | None, data: bytes) -> bool:
+    bucket = os.environ["AWS_S3_BUCKET_NAME"]
+
+    client = get_s3_client()
+    client.put_object(
+        Bucket=bucket,
+        Key=_fingerprints_key(url_hash),
+        Body=data,
+        ContentType="application/octet-stream",
+    )
+    return True
+
+
+@limited("s3")
+def get_fingerprints(url_hash: str | None) -> bytes | None:
+    bucket = os.environ["AWS_S3_BUCKET_NAME"]
+
+    client = get_s3_client()
+    try:
+        response = client.get_object(Bucket=bucket, Key=_fingerprints_key(url_hash))
+        return response["Body"].read()
+    except client.exceptions.NoSuchKey:
+        return None
@@ -0,0 +1,61 @@
+"""Per-podcast refresh scheduling from each feed's publishing cadence.
+
+A podcast's cadence is the median gap between its recent episodes. It is
+checked a few times per expected gap, within bounds, so a daily news show is
+refreshed every few hours while a monthly show is left alone for days. A
+show that has gone quiet for much longer than its cadence backs off further.
+"""
+
+from __future__ import annotations
+
+import math
+import random
+import statistics
+from datetime import timedelta
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from datetime import datetime
+
+WEEK_HOURS = 7 * 24
+MIN_PRIORITY, MAX_PRIORITY = -100, 100
+
+
+def publish_interval(published: list[datetime]) -> timedelta | None:
+    """Median gap between consecutive publish dates, if there are enough."""
+    dates = sorted(set(published))
+    if len(dates) < 2:
+        return None
+    return statistics.median(b - a for a, b in zip(dates, dates[1:]))
+
+
+def refresh_interval(
+    interval: timedelta | None,
+    last_published: datetime | None,
+    now: datetime,
+    checks_per_interval: int,
+    min_hours: float,
+    max_hours: float,
+    default_hours: float,
+) -> timedelta:
+    if interval is None:
+        return timedelta(hours=default_hours)
+    if last_published is not None:
+        # Dormant or irregular shows are checked less often the longer they
+        # have been quiet
+        interval = max(interval, (now - last_published) / 2)
+    hours = interval.total_seconds() / 3600 / checks_per_interval
+    return timedelta(hours=min(max(hours, min_hours), max_hours))
+
+
+def next_refresh_at(now: datetime, every: timedelta, jitter: float) -> datetime:
+    # Jitter keeps podcasts added together from staying in lockstep
+    return now + every * random.uniform(1 - jitter, 1 + jitter)
+
+
+def refresh_priority(interval_hours: float | None) -> int:
+    """Task priority: weekly shows get 0, more frequent shows more."""
+    if not interval_hours:
+        return 0
+    priority = round(10 * math.log2(WEEK_HOURS / interval_hours))
+    return max(MIN_PRIORITY, min(MAX_PRIORITY, priority))
@@ -1,31 +1,214 @@
-import modal
+"""Transcription backends.
 
-from .modal_transcription import Transcriber, app
+The backend used by `transcribe_audio_batch` is picked with
+`settings.TRANSCRIPTION`, following the same BACKEND/OPTIONS shape as
+Django's `TASKS` setting.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import logging
+import random
+import subprocess
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import cache
+from typing import Protocol
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from .audio import get_duration
+from .limits import get_limiter
 from .types import Segment, TranscriptionResult
+from .vad import prefilter_audio
+
+logger = logging.getLogger(__name__)
+
+
+class TranscriptionBackend(Protocol):
+    def transcribe_batch(
+        self, audio_items: list[tuple[str, bytes]]
+    ) -> list[TranscriptionResult]: ...
+
+
+class ModalBackend:
+    """Parakeet on a Modal GPU, see `modal_transcription`."""
+
+    def transcribe_batch(
+        self, audio_items: list[tuple[str, bytes]]
+    ) -> list[TranscriptionResult]:
+        import modal
+
+        from .modal_transcription import Transcriber, app
+
+        limiter = get_limiter("modal")
+
+        with modal.enable_output(), app.run():
+            transcriber = Transcriber()
+
+            # One call per episode, each holding a slot of the GPU budget
+            # shared with every other worker on the node
+            def transcribe(item: tuple[str, bytes]) -> dict:
+                filename, audio_bytes = item
+                with limiter.slot():
+                    return transcriber.transcribe.remote(audio_bytes, filename)
+
+            with ThreadPoolExecutor(max_workers=len(audio_items) or 1) as executor:
+                results = list(executor.map(transcribe, audio_items))
+
+        return [
+            TranscriptionResult(
+                text=result["text"],
+                segments=[
+                    Segment(start=seg["start"], end=seg["end"], text=seg["segment"])
+                    for seg in result["segments"]
+                ],
+            )
+            for result in results
+        ]
+
+
+_FILLER_TEXT = (
+    "so the thing is we were talking about how this actually works and "
+    "I think that is a really interesting point because when you look at "
+    "the numbers over the last few years you start to see a pattern that "
+    "most people just do not notice until somebody points it out"
+)
+_FILLER_WORDS = _FILLER_TEXT.split()
+
+_SPONSOR_READS = (
+    (
+        "This episode is brought to you by Acme Mattress. Go to acme dot com slash "
+        "podcast and use promo code LIMPA for twenty percent off your first order."
+    ),
+    (
+        "Support for the show comes from Northwind VPN. Protect your browsing for "
+        "less than three dollars a month at northwind dot com slash limpa."
+    ),
+)
+
+
+class LocalBackend:
+    """CPU-only stand-in that fabricates deterministic, timed segments.
+
+    Output depends only on the audio bytes, so runs are reproducible. A
+    pre-roll and a mid-roll sponsor read are injected to give the extraction
+    stage something to find. Latency is simulated as a per-batch cold start
+    plus `duration / realtime_factor` per episode, with at most
+    `max_concurrency` episodes in flight, which roughly matches Parakeet on
+    an A100 behind Modal's autoscaler.
+    """
+
+    def __init__(
+        self,
+        cold_start_seconds: float = 15.0,
+        realtime_factor: float = 300.0,
+        max_concurrency: int = 10,
+        words_per_second: float = 2.5,
+        simulate_latency: bool = True,
+    ):
+        self.cold_start_seconds = cold_start_seconds
+        self.realtime_factor = realtime_factor
+        self.max_concurrency = max_concurrency
+        self.words_per_second = words_per_second
+        self.simulate_latency = simulate_latency
+
+    def transcribe_batch(
+        self, audio_items: list[tuple[str, bytes]]
+    ) -> list[TranscriptionResult]:
+        if self.simulate_latency:
+            time.sleep(self.cold_start_seconds)
+
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+            return list(
+                executor.map(
+                    lambda item: self._transcribe_one(*item),
+                    audio_items,
+                )
+            )
+
+    def _transcribe_one(self, filename: str, audio_bytes: bytes) -> TranscriptionResult:
+        duration = _estimate_duration(audio_bytes)
+        if self.simulate_latency:
+            time.sleep(duration / self.realtime_factor)
+
+        rng = random.Random(hashlib.sha256(audio_bytes).digest())
+        ad_starts = {0.0, round(duration / 2)}
+
+        segments: list[Segment] = []
+        pos = 0.0
+        while pos < duration:
+            if any(pos <= ad_start < pos + 12 for ad_start in ad_starts):
+                text = rng.choice(_SPONSOR_READS)
+            else:
+                length = rng.randint(8, 30)
+                start = rng.randrange(len(_FILLER_WORDS))
+                text = " ".join(
+                    _FILLER_WORDS[(start + i) % len(_FILLER_WORDS)]
+                    for i in range(length)
+                )
+            end = min(duration, pos + len(text.split()) / self.words_per_second)
+            segments.append(Segment(start=round(pos, 2), end=round(end, 2), text=text))
+            pos = end + rng.uniform(0.1, 0.6)
+
+        logger.info(f"Locally transcribed {filename} ({duration:.0f}s)")
+        return TranscriptionResult(
+            text=" ".join(seg.text for seg in segments), segments=segments
+        )
+
+
+_PROBE_ERRORS = (subprocess.CalledProcessError, ValueError, OSError)
+
+
+def _estimate_duration(audio_bytes: bytes) -> float:
+    try:
+        return get_duration(audio_bytes)
+    except _PROBE_ERRORS:
+        # Assume 128 kbps when ffprobe can't read the input (e.g. synthetic bytes)
+        return len(audio_bytes) / (128_000 / 8)
+
+
+@cache
+def get_transcription_backend() -> TranscriptionBackend:
+    config = settings.TRANSCRIPTION
+    backend_cls = import_string(config["BACKEND"])
+    return backend_cls(**config.get("OPTIONS", {}))
 
 
 def transcribe_audio_batch(
     audio_items: list[tuple[str, bytes]],
+    skip_spans: list[list[tuple[float, float]]] | None = None,
 ) -> list[TranscriptionResult]:
+    """Transcribe each item, leaving out its `skip_spans` (e.g. known ad spots).
+
+    Returned timestamps always refer to the original, unfiltered audio.
+    """
     if not audio_items:
         return []
 
-    with modal.enable_output(), app.run():
-        transcriber = Transcriber()
-        results = list(
-            transcriber.transcribe.map(
-                [audio_bytes for _, audio_bytes in audio_items],
-                [filename for filename, _ in audio_items],
-            )
-        )
+    backend = get_transcription_backend()
+    skip_spans = skip_spans or [[] for _ in audio_items]
+    if not settings.VAD_ENABLED and not any(skip_spans):
+        return backend.transcribe_batch(audio_items)
 
-    return [
-        TranscriptionResult(
-            text=result["text"],
-            segments=[
-                Segment(start=seg["start"], end=seg["end"], text=seg["segment"])
-                for seg in result["segments"]
-            ],
+    filtered = [
+        prefilter_audio(
+            audio_bytes, detect_speech=settings.VAD_ENABLED, skip_spans=skip
         )
-        for result in results
+        for (_, audio_bytes), skip in zip(audio_items, skip_spans)
     ]
+    for (filename, _), item in zip(audio_items, filtered):
+        logger.info(
+            f"Pre-filter kept {item.kept_seconds:.0f}s of "
+            f"{item.original_seconds:.0f}s for {filename}"
+        )
+
+    results = backend.transcribe_batch(
+        [
+            (filename, item.audio_bytes)
+            for (filename, _), item in zip(audio_items, filtered)
+        ]
+    )
+    return [item.time_map.remap(result) for item, result in zip(filtered, results)]
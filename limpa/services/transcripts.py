@@ -0,0 +1,111 @@
+"""Compact storage format for transcripts.
+
+A transcript is stored as columns instead of one JSON object per segment:
+float32 start and end times, the segment texts joined into one string, and
+each segment's offset into it. The payload is zstd-compressed with the
+standard library's `compression.zstd`. Loading it back gives a
+`TranscriptionResult` whose segments are a view over those columns, so a
+`Segment` is only built when it is accessed.
+"""
+
+from __future__ import annotations
+
+import struct
+from collections.abc import Sequence
+from compression import zstd
+from typing import TYPE_CHECKING, overload
+
+import numpy as np
+
+from .types import Segment, TranscriptionResult
+
+if TYPE_CHECKING:
+    from collections.abc import Iterator
+
+MAGIC = b"LTR1"
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+
+
+class SegmentView(Sequence[Segment]):
+    def __init__(
+        self, starts: np.ndarray, ends: np.ndarray, text: str, offsets: np.ndarray
+    ):
+        self._starts = starts
+        self._ends = ends
+        self._text = text
+        self._offsets = offsets
+
+    def __len__(self) -> int:
+        return len(self._starts)
+
+    def _segment(self, index: int) -> Segment:
+        return Segment.model_construct(
+            start=float(self._starts[index]),
+            end=float(self._ends[index]),
+            text=self._text[self._offsets[index] : self._offsets[index + 1]],
+        )
+
+    @overload
+    def __getitem__(self, index: int) -> Segment: ...
+
+    @overload
+    def __getitem__(self, index: slice) -> list[Segment]: ...
+
+    def __getitem__(self, index: int | slice) -> Segment | list[Segment]:
+        if isinstance(index, slice):
+            return [self._segment(i) for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("segment index out of range")
+        return self._segment(index)
+
+    def __iter__(self) -> Iterator[Segment]:
+        offsets = self._offsets.tolist()
+        for start, end, lo, hi in zip(
+            self._starts.tolist(), self._ends.tolist(), offsets, offsets[1:]
+        ):
+            yield Segment.model_construct(start=start, end=end, text=self._text[lo:hi])
+
+
+def pack_transcript(transcription: TranscriptionResult) -> bytes:
+    segments = transcription.segments
+    texts = [seg.text for seg in segments]
+    offsets = np.zeros(len(texts) + 1, dtype="<u4")
+    np.cumsum([len(text) for text in texts], out=offsets[1:])
+    payload = b"".join(
+        [
+            MAGIC,
+            struct.pack("<I", len(texts)),
+            np.array([seg.start for seg in segments], dtype="<f4").tobytes(),
+            np.array([seg.end for seg in segments], dtype="<f4").tobytes(),
+            offsets.tobytes(),
+            "".join(texts).encode("utf-8"),
+        ]
+    )
+    return zstd.compress(payload)
+
+
+def _unpack(payload: bytes) -> TranscriptionResult:
+    if not payload.startswith(MAGIC):
+        raise ValueError("Not a packed transcript")
+    (count,) = struct.unpack_from("<I", payload, len(MAGIC))
+    pos = len(MAGIC) + 4
+    starts = np.frombuffer(payload, dtype="<f4", count=count, offset=pos)
+    ends = np.frombuffer(payload, dtype="<f4", count=count, offset=pos + 4 * count)
+    offsets = np.frombuffer(
+        payload, dtype="<u4", count=count + 1, offset=pos + 8 * count
+    )
+    text = payload[pos + 12 * count + 4 :].decode("utf-8")
+    bounds = offsets.tolist()
+    return TranscriptionResult.model_construct(
+        text=" ".join(text[lo:hi].strip() for lo, hi in zip(bounds, bounds[1:])),
+        segments=SegmentView(starts, ends, text, offsets),
+    )
+
+
+def load_transcript(data: bytes) -> TranscriptionResult:
+    if data.startswith(ZSTD_MAGIC):
+        return _unpack(zstd.decompress(data))
+    # Transcripts stored before packing are pydantic JSON
+    return TranscriptionResult.model_validate_json(data)
@@ -1,3 +1,6 @@
+# Pydantic resolves field annotations at runtime
+from collections.abc import Sequence  # noqa: TC003
+
 from pydantic import BaseModel
 
 
@@ -9,7 +12,8 @@ class Segment(BaseModel):
 
 class TranscriptionResult(BaseModel):
     text: str
-    segments: list[Segment]
+    # A lazy `SegmentView` for transcripts loaded from storage
+    segments: Sequence[Segment]
 
     def readable_segments(self) -> str:
         return "\n".join(
@@ -28,3 +32,11 @@ class AdvertisementItem(BaseModel):
 
 class AdvertisementData(BaseModel):
     ads_list: list[AdvertisementItem]
+
+
+class ScoredAdvertisementItem(AdvertisementItem):
+    confidence: float
+
+
+class ScoredAdvertisementData(BaseModel):
+    ads_list: list[ScoredAdvertisementItem]
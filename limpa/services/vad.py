@@ -0,0 +1,231 @@
+"""Voice-activity pre-filter that drops silence and music before transcription."""
+
+from __future__ import annotations
+
+import bisect
+import logging
+from dataclasses import dataclass
+
+import numpy as np
+from django.conf import settings
+
+from .audio import decode_pcm, encode_pcm
+from .types import Segment, TranscriptionResult
+
+logger = logging.getLogger(__name__)
+
+SAMPLE_RATE = 16000
+FRAME_SECONDS = 0.025
+HOP_SECONDS = 0.010
+CONTEXT_SECONDS = 1.0
+SMOOTHING_SECONDS = 0.3
+SPEECH_BAND_HZ = (300.0, 3400.0)
+FRAMES_PER_CHUNK = 8192
+
+_EPS = 1e-10
+
+
+def _moving_average(values: np.ndarray, width: int) -> np.ndarray:
+    if width <= 1 or len(values) == 0:
+        return values.astype(np.float64)
+    kernel = np.ones(width) / width
+    return np.convolve(values, kernel, mode="same")
+
+
+def frame_features(
+    pcm: np.ndarray, sample_rate: int = SAMPLE_RATE
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Return per-frame energy (dB), speech-band ratio and spectral flatness."""
+    frame_len = int(sample_rate * FRAME_SECONDS)
+    hop = int(sample_rate * HOP_SECONDS)
+    if len(pcm) < frame_len:
+        empty = np.zeros(0)
+        return empty, empty, empty
+
+    frames = np.lib.stride_tricks.sliding_window_view(pcm, frame_len)[::hop]
+    window = np.hanning(frame_len).astype(np.float32)
+    freqs = np.fft.rfftfreq(frame_len, 1 / sample_rate)
+    band = (freqs >= SPEECH_BAND_HZ[0]) & (freqs <= SPEECH_BAND_HZ[1])
+
+    energy_db = np.empty(len(frames))
+    band_ratio = np.empty(len(frames))
+    flatness = np.empty(len(frames))
+    # Chunked so a multi-hour episode never materializes one huge spectrogram
+    for start in range(0, len(frames), FRAMES_PER_CHUNK):
+        chunk = slice(start, start + FRAMES_PER_CHUNK)
+        power = np.abs(np.fft.rfft(frames[chunk] * window, axis=1)) ** 2 + _EPS
+        total = power.sum(axis=1)
+        energy_db[chunk] = 10 * np.log10(total)
+        band_ratio[chunk] = power[:, band].sum(axis=1) / total
+        flatness[chunk] = np.exp(np.log(power).mean(axis=1)) / power.mean(axis=1)
+
+    return energy_db, band_ratio, flatness
+
+
+def find_speech_spans(
+    pcm: np.ndarray,
+    sample_rate: int = SAMPLE_RATE,
+    energy_threshold_db: float = 12.0,
+    min_silence_seconds: float = 2.0,
+    padding_seconds: float = 0.25,
+) -> list[tuple[float, float]]:
+    """Return (start, end) spans in seconds that likely contain speech.
+
+    A frame counts as speech when it is well above the episode's noise floor,
+    most of its energy sits in the speech band, it is not noise-like, and its
+    surrounding second shows the syllabic energy dips that sustained music
+    lacks. Non-speech gaps shorter than `min_silence_seconds` are kept.
+    """
+    energy_db, band_ratio, flatness = frame_features(pcm, sample_rate)
+    if len(energy_db) == 0:
+        return []
+
+    context = int(CONTEXT_SECONDS / HOP_SECONDS)
+    rms = np.sqrt(10 ** (energy_db / 10))
+    low_energy = rms < 0.5 * _moving_average(rms, context)
+    low_energy_ratio = _moving_average(low_energy.astype(np.float64), context)
+
+    noise_floor = np.percentile(energy_db, 10)
+    is_speech = (
+        (energy_db > noise_floor + energy_threshold_db)
+        & (band_ratio > 0.4)
+        & (flatness < 0.5)
+        & (low_energy_ratio > 0.1)
+    )
+    smoothed = _moving_average(
+        is_speech.astype(np.float64), int(SMOOTHING_SECONDS / HOP_SECONDS)
+    )
+    is_speech = smoothed > 0.5
+
+    edges = np.flatnonzero(
+        np.diff(np.concatenate(([0], is_speech.astype(np.int8), [0])))
+    )
+    starts, ends = edges[::2] * HOP_SECONDS, edges[1::2] * HOP_SECONDS
+
+    duration = len(pcm) / sample_rate
+    spans: list[tuple[float, float]] = []
+    for start, end in zip(starts.tolist(), ends.tolist()):
+        start = max(0.0, start - padding_seconds)
+        end = min(duration, end + padding_seconds)
+        if spans and start - spans[-1][1] < min_silence_seconds:
+            spans[-1] = (spans[-1][0], end)
+        else:
+            spans.append((start, end))
+    return spans
+
+
+@dataclass
+class TimeMap:
+    """Maps timestamps in the filtered audio back to the original audio."""
+
+    kept_spans: list[tuple[float, float]]
+    gap_seconds: float = 0.0
+
+    def __post_init__(self):
+        self._filtered_starts: list[float] = []
+        pos = 0.0
+        for start, end in self.kept_spans:
+            self._filtered_starts.append(pos)
+            pos += end - start + self.gap_seconds
+
+    def to_original(self, t: float, is_end: bool = False) -> float:
+        if not self.kept_spans:
+            return t
+        i = max(0, bisect.bisect_right(self._filtered_starts, t) - 1)
+        start, end = self.kept_spans[i]
+        offset = t - self._filtered_starts[i]
+        if offset > end - start:
+            # Inside the inserted gap: snap to the nearest kept boundary
+            if is_end or i + 1 == len(self.kept_spans):
+                return end
+            return self.kept_spans[i + 1][0]
+        return start + offset
+
+    def remap(self, result: TranscriptionResult) -> TranscriptionResult:
+        return TranscriptionResult(
+            text=result.text,
+            segments=[
+                Segment(
+                    start=self.to_original(seg.start),
+                    end=self.to_original(seg.end, is_end=True),
+                    text=seg.text,
+                )
+                for seg in result.segments
+            ],
+        )
+
+
+@dataclass
+class FilteredAudio:
+    audio_bytes: bytes
+    time_map: TimeMap
+    original_seconds: float
+    kept_seconds: float
+
+
+def subtract_spans(
+    spans: list[tuple[float, float]], remove: list[tuple[float, float]]
+) -> list[tuple[float, float]]:
+    result = []
+    for start, end in spans:
+        for cut_start, cut_end in sorted(remove):
+            if cut_end <= start or cut_start >= end:
+                continue
+            if cut_start > start:
+                result.append((start, cut_start))
+            start = max(start, cut_end)
+        if start < end:
+            result.append((start, end))
+    return result
+
+
+def prefilter_audio(
+    audio_bytes: bytes,
+    detect_speech: bool = True,
+    skip_spans: list[tuple[float, float]] | None = None,
+) -> FilteredAudio:
+    """Drop non-speech (when `detect_speech`) and `skip_spans` from the audio."""
+    pcm = decode_pcm(audio_bytes, sample_rate=SAMPLE_RATE)
+    duration = len(pcm) / SAMPLE_RATE
+    spans = (
+        find_speech_spans(
+            pcm,
+            min_silence_seconds=settings.VAD_MIN_SILENCE_SECONDS,
+            padding_seconds=settings.VAD_PADDING_SECONDS,
+        )
+        if detect_speech
+        else [(0.0, duration)]
+    )
+    if skip_spans:
+        spans = subtract_spans(spans, skip_spans)
+    # Snap to whole samples so the time map matches the concatenated audio
+    spans = [
+        (
+            round(start * SAMPLE_RATE) / SAMPLE_RATE,
+            round(end * SAMPLE_RATE) / SAMPLE_RATE,
+        )
+        for start, end in spans
+    ]
+    kept_seconds = sum(end - start for start, end in spans)
+
+    if not spans or kept_seconds >= duration:
+        # Nothing to drop (or nothing recognised as speech): send the original
+        return FilteredAudio(
+            audio_bytes=audio_bytes,
+            time_map=TimeMap(kept_spans=[]),
+            original_seconds=duration,
+            kept_seconds=duration,
+        )
+
+    gap = np.zeros(int(settings.VAD_GAP_SECONDS * SAMPLE_RATE), dtype=np.float32)
+    pieces: list[np.ndarray] = []
+    for start, end in spans:
+        pieces.append(pcm[round(start * SAMPLE_RATE) : round(end * SAMPLE_RATE)])
+        pieces.append(gap)
+
+    return FilteredAudio(
+        audio_bytes=encode_pcm(np.concatenate(pieces), sample_rate=SAMPLE_RATE),
+        time_map=TimeMap(kept_spans=spans, gap_seconds=len(gap) / SAMPLE_RATE),
+        original_seconds=duration,
+        kept_seconds=kept_seconds,
+    )
@@ -1,27 +1,70 @@
+from __future__ import annotations
+
+import hashlib
+import json
 import logging
 import tempfile
-from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import timedelta
 from pathlib import Path
 from typing import TYPE_CHECKING
 
 from django.conf import settings
 from django.tasks import task  # type: ignore[import-not-found]
+from django.urls import reverse
 from django.utils import timezone
 
-from limpa.services.audio import remove_ads_from_audio
-from limpa.services.extract import extract_from_transcription
-from limpa.services.feed import Episode, get_latest_episodes, regenerate_feed
-from limpa.services.http import get_with_retry
-from limpa.services.s3 import upload_episode_audio, upload_episode_transcript
+from limpa.leases import Leases, episode_key, exclusive, podcast_key, store_key
+from limpa.models import Episode, Podcast, ProcessingLease
+from limpa.services.ad_index import load_ad_index, save_ad_index
+from limpa.services.admission import (
+    Footprint,
+    NotAdmitted,
+    estimate_footprint,
+    get_admission_controller,
+)
+from limpa.services.audio import OUTPUT_PROFILES, remove_ads_from_audio
+from limpa.services.extract import PROMPT_VERSION, extract_ads_batch, merge_ads
+from limpa.services.feed import (
+    FeedEpisode,
+    FeedError,
+    fetch_and_validate_feed,
+    get_latest_episodes,
+    regenerate_feed,
+)
+from limpa.services.fingerprint import AdSpotLibrary, fingerprint_audio
+from limpa.services.http import get_content_length, get_with_retry
+from limpa.services.s3 import (
+    audio_prefix,
+    delete_prefix,
+    get_episode_transcript,
+    object_key,
+    upload_episode_audio,
+    upload_episode_transcript,
+    upload_feed_xml,
+)
+from limpa.services.schedule import (
+    MAX_PRIORITY,
+    next_refresh_at,
+    publish_interval,
+    refresh_interval,
+)
 from limpa.services.transcribe import transcribe_audio_batch
+from limpa.services.transcripts import load_transcript, pack_transcript
+from limpa.services.types import AdvertisementData
 
 if TYPE_CHECKING:
-    from limpa.services.types import TranscriptionResult
+    from limpa.services.ad_index import AdIndex
+    from limpa.services.fingerprint import Fingerprint
+    from limpa.services.types import AdvertisementItem, TranscriptionResult
 
 logger = logging.getLogger(__name__)
 
+# Where an episode's cleaned audio is and how it was written
+AUDIO_FIELDS = ["s3_url", "output_profile", "audio_mime_type", "audio_size"]
+
 
-def _download_episode(episode: Episode) -> tuple[Path, bytes]:
+def _download_episode(episode: FeedEpisode) -> tuple[Path, bytes]:
     audio_bytes = get_with_retry(url=episode.url)
     with tempfile.NamedTemporaryFile(suffix=".mp3", delete=False) as f:
         f.write(audio_bytes)
@@ -29,113 +72,732 @@ def _download_episode(episode: Episode) -> tuple[Path, bytes]:
     return temp_path, audio_bytes
 
 
+def _audio_hash(audio_bytes: bytes) -> str:
+    return hashlib.sha256(audio_bytes).hexdigest()
+
+
+def _admit(episodes: list[FeedEpisode], deferrals: int) -> str | None:
+    """Reserve room for downloading and cutting `episodes`.
+
+    Raises `NotAdmitted` while the node is short, until the task has been
+    deferred ADMISSION_MAX_DEFERRALS times.
+    """
+    controller = get_admission_controller()
+    if controller is None:
+        return None
+    need = sum(
+        (
+            estimate_footprint(
+                get_content_length(ep.url),
+                ep.duration_seconds,
+                default_bytes=settings.ADMISSION_DEFAULT_EPISODE_MB * 1024 * 1024,
+            )
+            for ep in episodes
+        ),
+        Footprint(),
+    )
+    return controller.admit(need, force=deferrals >= settings.ADMISSION_MAX_DEFERRALS)
+
+
+def _defer(task_, deferrals: int, priority: int | None = None, **kwargs) -> None:
+    """Queue `task_` again once the node may have room for it."""
+    options = {
+        "run_after": timezone.now()
+        + timedelta(seconds=settings.ADMISSION_RETRY_SECONDS)
+    }
+    if priority is not None:
+        options["priority"] = priority
+    task_.using(**options).enqueue(deferrals=deferrals + 1, **kwargs)
+
+
+def _release(reservation: str | None) -> None:
+    controller = get_admission_controller()
+    if controller is not None and reservation is not None:
+        controller.release(reservation)
+
+
+def _get_spot_library(podcast: Podcast) -> AdSpotLibrary | None:
+    if not settings.FINGERPRINT_ENABLED:
+        return None
+    return AdSpotLibrary(
+        url_hash=podcast.url_hash,
+        max_spots=settings.FINGERPRINT_MAX_SPOTS_PER_PODCAST,
+        max_global_spots=settings.FINGERPRINT_MAX_GLOBAL_SPOTS,
+        share_spots=settings.FINGERPRINT_SHARE_SPOTS,
+    )
+
+
+def _load_ad_index(podcast: Podcast, exclude_guids: list[str]) -> AdIndex:
+    return load_ad_index(
+        url_hash=podcast.url_hash,
+        bootstrap_episodes=podcast.episodes.filter(status=Episode.Status.READY)
+        .exclude(guid__in=exclude_guids)
+        .only("guid", "audio_hash", "transcript_url", "ads")
+        .order_by("-processed_at")[: settings.AD_INDEX_BOOTSTRAP_EPISODES],
+    )
+
+
+def _learn_ads(
+    podcast: Podcast,
+    learned: list[tuple[TranscriptionResult, AdvertisementData]],
+    exclude_guids: list[str],
+) -> None:
+    """Add confirmed ads to the podcast's ad index. The index is re-read under
+    its lease so ads saved by other workers meanwhile aren't lost."""
+    with exclusive([store_key("ad_index", podcast.url_hash)]) as acquired:
+        if not acquired:
+            logger.warning(f"Skipped updating the ad index of {podcast.title}")
+            return
+        ad_index = _load_ad_index(podcast, exclude_guids=exclude_guids)
+        for transcription, ads in learned:
+            ad_index.add_episode(
+                transcription, ads, min_containment=settings.AD_INDEX_MIN_CONTAINMENT
+            )
+        save_ad_index(url_hash=podcast.url_hash, ad_index=ad_index)
+
+
+def _learn_spots(
+    spot_library: AdSpotLibrary,
+    learned: list[tuple[Fingerprint, AdvertisementData]],
+) -> None:
+    """Add confirmed ads to the spot stores. The stores are re-read under
+    their leases so spots saved by other workers meanwhile aren't lost."""
+    keys = [store_key("fingerprints", spot_library.url_hash)]
+    if spot_library.share_spots:
+        keys.append(store_key("fingerprints", "global"))
+    with exclusive(keys) as acquired:
+        if not acquired:
+            logger.warning(f"Skipped learning ad spots for {spot_library.url_hash}")
+            return
+        spot_library.reload()
+        for fingerprint, ads in learned:
+            spot_library.learn(fingerprint, ads)
+        spot_library.save()
+
+
+def _cut_id(ads: AdvertisementData) -> str:
+    """Short hash of the spans `ads` removes."""
+    spans = sorted(
+        (round(ad.start_timestamp_seconds, 3), round(ad.end_timestamp_seconds, 3))
+        for ad in ads.ads_list
+    )
+    return hashlib.sha256(json.dumps(spans).encode()).hexdigest()[:12]
+
+
+def _cut_and_upload(
+    audio_hash: str, temp_path: Path, ads: AdvertisementData, output_profile: str
+) -> tuple[dict, Path]:
+    """Returns the episode's audio fields and the file to clean up."""
+    temp_output, profile = remove_ads_from_audio(
+        input_path=temp_path, ads=ads, profile=OUTPUT_PROFILES[output_profile]
+    )
+    s3_url = upload_episode_audio(
+        audio_hash=audio_hash,
+        version=PROMPT_VERSION,
+        audio_path=temp_output,
+        profile=profile,
+        cut=_cut_id(ads),
+    )
+    logger.info(f"Uploaded processed audio for {audio_hash} as {profile.name}")
+    audio = {
+        "s3_url": s3_url,
+        "output_profile": output_profile,
+        "audio_mime_type": profile.mime_type,
+        "audio_size": temp_output.stat().st_size,
+    }
+    return audio, temp_output
+
+
+def _cleaned_fields(audio: dict, ads: AdvertisementData) -> dict:
+    return {
+        **audio,
+        "ads": ads.model_dump(),
+        "status": Episode.Status.READY,
+        "processed_at": timezone.now(),
+        "prompt_version": PROMPT_VERSION,
+    }
+
+
+def _audio_key(audio_hash: str) -> str:
+    """Held while an audio's references are checked or copied, see
+    `_delete_unreferenced_audio`."""
+    return store_key("audio", audio_hash)
+
+
+def _claim_audio(podcast: Podcast, episode: FeedEpisode, audio_hash: str) -> bool:
+    """Point the episode at its audio, and reuse an earlier result if there
+    is one. Returns whether it was reused."""
+    with exclusive([_audio_key(audio_hash)]) as acquired:
+        if not acquired:
+            raise RuntimeError(f"Timed out claiming audio {audio_hash}")
+        podcast.episodes.filter(guid=episode.guid).update(audio_hash=audio_hash)
+        return _reuse_processed(podcast, episode, audio_hash)
+
+
+def _reuse_processed(podcast: Podcast, episode: FeedEpisode, audio_hash: str) -> bool:
+    """Copy the result of an earlier run on the same audio, from any feed."""
+    source = (
+        Episode.objects.filter(
+            audio_hash=audio_hash,
+            status=Episode.Status.READY,
+            prompt_version=PROMPT_VERSION,
+            output_profile=podcast.output_profile,
+        )
+        .exclude(s3_url="")
+        .only(*AUDIO_FIELDS, "transcript_url", "ads")
+        .first()
+    )
+    if source is None:
+        return False
+    Episode.upsert(
+        podcast,
+        episode.guid,
+        audio_hash=audio_hash,
+        transcript_url=source.transcript_url,
+        **_cleaned_fields(
+            {name: getattr(source, name) for name in AUDIO_FIELDS},
+            AdvertisementData.model_validate(source.ads),
+        ),
+    )
+    logger.info(f"Reused processed audio {audio_hash} for {episode.guid}")
+    return True
+
+
+def _schedule_fields(episodes: list[FeedEpisode]) -> dict:
+    now = timezone.now()
+    published = [ep.published_at for ep in episodes if ep.published_at]
+    interval = publish_interval(published)
+    every = refresh_interval(
+        interval,
+        last_published=max(published, default=None),
+        now=now,
+        checks_per_interval=settings.SCHEDULE_CHECKS_PER_INTERVAL,
+        min_hours=settings.SCHEDULE_MIN_INTERVAL_HOURS,
+        max_hours=settings.SCHEDULE_MAX_INTERVAL_HOURS,
+        default_hours=settings.SCHEDULE_DEFAULT_INTERVAL_HOURS,
+    )
+    return {
+        "publish_interval_hours": interval.total_seconds() / 3600 if interval else None,
+        "next_refresh_at": next_refresh_at(now, every, jitter=settings.SCHEDULE_JITTER),
+    }
+
+
+def _episode_audio_url(episode: Episode) -> str:
+    path = reverse("episode_audio", kwargs={"episode_id": episode.id})
+    return f"{settings.LIMPA_BASE_URL.rstrip('/')}{path}"
+
+
+def _regenerate_feed(podcast: Podcast) -> None:
+    if settings.PODCAST_PROCESSING_MODE == "on_demand":
+        # Unprocessed episodes are listed too, pointed at `episode_audio`
+        episodes = podcast.episodes.only("original_url", "title", *AUDIO_FIELDS)
+        redirect_url = _episode_audio_url
+    else:
+        episodes = podcast.episodes.filter(status=Episode.Status.READY).only(
+            "original_url", "title", *AUDIO_FIELDS
+        )
+        redirect_url = None
+    regenerate_feed(
+        url=podcast.url,
+        url_hash=podcast.url_hash,
+        episodes=episodes.iterator(),
+        podcast_title=podcast.title,
+        redirect_url=redirect_url,
+    )
+
+
+def _register_episodes(podcast: Podcast, episodes: list[FeedEpisode]) -> None:
+    """List feed episodes as pending so listeners can request them."""
+    Episode.objects.bulk_create(
+        [
+            Episode(
+                podcast=podcast,
+                guid=ep.guid,
+                original_url=ep.url,
+                title=ep.title,
+                published_at=ep.published_at,
+                status=Episode.Status.PENDING,
+            )
+            for ep in episodes
+        ],
+        ignore_conflicts=True,
+    )
+    # Failed runs, and runs whose worker died, are retried on the next listen
+    retry = list(
+        podcast.episodes.filter(
+            guid__in=[ep.guid for ep in episodes],
+            status__in=[Episode.Status.PROCESSING, Episode.Status.FAILED],
+        ).only("guid", "status")
+    )
+    running = ProcessingLease.held([episode_key(podcast.id, ep.guid) for ep in retry])
+    podcast.episodes.filter(
+        pk__in=[
+            ep.pk
+            for ep in retry
+            if ep.status == Episode.Status.FAILED
+            or episode_key(podcast.id, ep.guid) not in running
+        ]
+    ).update(status=Episode.Status.PENDING)
+
+
+@task
+def onboard_podcast(podcast_id: int) -> None:
+    """Validate and store a newly added feed, then start its first refresh."""
+    podcast = Podcast.objects.get(id=podcast_id)
+    try:
+        feed_data = fetch_and_validate_feed(podcast.url)
+    except FeedError as e:
+        logger.warning(f"Feed validation failed for {podcast.url}: {e}")
+        podcast.set_status(Podcast.Status.FAILED, error=str(e)[:500])
+        return
+
+    podcast.set_status(
+        Podcast.Status.PENDING,
+        title=feed_data.title[:500],
+        episode_count=feed_data.episode_count,
+    )
+    try:
+        upload_feed_xml(url_hash=podcast.url_hash, xml_content=feed_data.raw_xml)
+        logger.info(f"Uploaded feed for podcast {podcast.title}")
+    except Exception as e:
+        podcast.set_status(Podcast.Status.FAILED)
+        logger.error(f"S3 upload failed for podcast {podcast.title}: {e}")
+
+    process_podcast.enqueue(podcast_id=podcast.id)  # type: ignore[attr-defined]
+
+
 @task
-def process_podcast(podcast_id: int) -> None:
-    from limpa.models import Podcast
+def process_podcast(podcast_id: int, deferrals: int = 0) -> None:
+    try:
+        with Leases(ttl_seconds=settings.PROCESSING_LEASE_SECONDS) as leases:
+            if leases.acquire(podcast_key(podcast_id)):
+                _process_podcast(podcast_id, leases, deferrals)
+    except NotAdmitted:
+        _defer(process_podcast, deferrals, podcast_id=podcast_id)
+
 
+def _process_podcast(podcast_id: int, leases: Leases, deferrals: int) -> None:
     podcast = Podcast.objects.get(id=podcast_id)
     logger.info(f"Processing podcast: {podcast.title} (id={podcast_id})")
 
-    podcast.status = Podcast.Status.PROCESSING
-    podcast.last_refreshed_at = timezone.now()
-    podcast.save(update_fields=["status", "last_refreshed_at"])
+    podcast.set_status(Podcast.Status.PROCESSING, last_refreshed_at=timezone.now())
 
-    episodes: list[Episode] = get_latest_episodes(
-        url=podcast.url, count=settings.PODCAST_EPISODES_TO_PROCESS
+    on_demand = settings.PODCAST_PROCESSING_MODE == "on_demand"
+    window = (
+        settings.PODCAST_ON_DEMAND_EPISODES
+        if on_demand
+        else settings.PODCAST_EPISODES_TO_PROCESS
+    )
+    # Older episodes are only fetched to learn the feed's cadence
+    feed_episodes: list[FeedEpisode] = get_latest_episodes(
+        url=podcast.url, count=max(window, settings.SCHEDULE_CADENCE_EPISODES)
     )
-    processed_guids = set(podcast.processed_episodes.keys())
+    schedule = _schedule_fields(feed_episodes)
+    episodes = feed_episodes[:window]
+
+    if on_demand:
+        _register_episodes(podcast, episodes)
+        podcast.set_status(Podcast.Status.READY, **schedule)
+        _regenerate_feed(podcast)
+        logger.info(f"Listed {len(episodes)} episodes of {podcast.title} on demand")
+        return
 
-    new_episodes = [ep for ep in episodes if ep.guid not in processed_guids]
+    processed_guids = set(
+        podcast.episodes.filter(
+            guid__in=[ep.guid for ep in episodes], status=Episode.Status.READY
+        ).values_list("guid", flat=True)
+    )
+
+    new_episodes = [
+        ep
+        for ep in episodes
+        if ep.guid not in processed_guids
+        and leases.acquire(episode_key(podcast.id, ep.guid))
+    ]
     if not new_episodes:
         logger.info("No new episodes to process")
-        podcast.status = Podcast.Status.READY
-        podcast.save(update_fields=["status"])
+        podcast.set_status(Podcast.Status.READY, **schedule)
         return
 
     logger.info(f"Found {len(new_episodes)} new episodes to process")
+    try:
+        _process_episodes(podcast, new_episodes, deferrals)
+
+        podcast.set_status(
+            Podcast.Status.READY, last_refreshed_at=timezone.now(), **schedule
+        )
+        logger.info(f"Processed {len(new_episodes)} episodes for {podcast.title}")
+
+        _regenerate_feed(podcast)
+
+    except NotAdmitted:
+        podcast.set_status(Podcast.Status.PENDING)
+        raise
+
+    except Exception as e:
+        logger.error(f"Failed to process podcast {podcast.title}: {e}")
+        podcast.set_status(Podcast.Status.FAILED)
+        raise
+
+
+@task
+def process_episode(episode_id: int, deferrals: int = 0) -> None:
+    """Process one episode a listener asked for, in on-demand mode."""
+    episode = Episode.objects.select_related("podcast").get(id=episode_id)
+    podcast = episode.podcast
+    try:
+        with Leases(ttl_seconds=settings.PROCESSING_LEASE_SECONDS) as leases:
+            if not leases.acquire(episode_key(podcast.id, episode.guid)):
+                return
+            episode.refresh_from_db(fields=["status"])
+            if episode.status == Episode.Status.READY:
+                return
+            logger.info(
+                f"Processing requested episode {episode.guid} of {podcast.title}"
+            )
+            _process_episodes(
+                podcast,
+                [
+                    FeedEpisode(
+                        guid=episode.guid,
+                        url=episode.original_url,
+                        title=episode.title,
+                        published_at=episode.published_at,
+                    )
+                ],
+                deferrals,
+            )
+            _regenerate_feed(podcast)
+    except NotAdmitted:
+        # Still PROCESSING, and claimable again since the lease is released
+        _defer(process_episode, deferrals, priority=MAX_PRIORITY, episode_id=episode_id)
+
+
+def _process_episodes(
+    podcast: Podcast, new_episodes: list[FeedEpisode], deferrals: int = 0
+) -> None:
+    """Download, transcribe, extract and cut `new_episodes`, whose episode
+    leases the caller holds. They are marked failed if anything goes wrong.
+
+    Raises `NotAdmitted`, before touching any episode, if the node has no room.
+    """
+    reservation = _admit(new_episodes, deferrals)
+    for episode in new_episodes:
+        Episode.upsert(
+            podcast,
+            episode.guid,
+            original_url=episode.url,
+            title=episode.title,
+            published_at=episode.published_at,
+            status=Episode.Status.PROCESSING,
+        )
 
     temp_files: list[Path] = []
+    downloaded: list[tuple[FeedEpisode, Path, bytes, str]] = []
     try:
-        downloaded: list[tuple[Episode, Path, bytes]] = []
         for episode in new_episodes:
             temp_path, audio_bytes = _download_episode(episode)
             temp_files.append(temp_path)
-            downloaded.append((episode, temp_path, audio_bytes))
             logger.info(f"Downloaded episode {episode.guid}")
+            audio_hash = _audio_hash(audio_bytes)
+            if not _claim_audio(podcast, episode, audio_hash):
+                downloaded.append((episode, temp_path, audio_bytes, audio_hash))
+        if not downloaded:
+            return
 
         audio_items = [
-            (f"{ep.guid}.mp3", audio_bytes) for ep, _, audio_bytes in downloaded
+            (f"{ep.guid}.mp3", audio_bytes) for ep, _, audio_bytes, _ in downloaded
         ]
-        transcriptions = transcribe_audio_batch(audio_items=audio_items)
+        spot_library = _get_spot_library(podcast)
+        fingerprints: list[Fingerprint] = []
+        known_spots: list[list[AdvertisementItem]] = [[] for _ in downloaded]
+        if spot_library is not None:
+            fingerprints = [fingerprint_audio(audio) for _, _, audio, _ in downloaded]
+            known_spots = [spot_library.match(fp) for fp in fingerprints]
+            for (episode, _, _, _), spots in zip(downloaded, known_spots):
+                logger.info(f"Matched {len(spots)} known ad spots in {episode.guid}")
+
+        transcriptions = transcribe_audio_batch(
+            audio_items=audio_items,
+            skip_spans=[
+                [(ad.start_timestamp_seconds, ad.end_timestamp_seconds) for ad in spots]
+                for spots in known_spots
+            ],
+        )
         logger.info(f"Transcribed {len(transcriptions)} episodes in parallel")
 
         def _upload_transcript(
-            episode: Episode, transcription: TranscriptionResult
+            episode: FeedEpisode, audio_hash: str, transcription: TranscriptionResult
         ) -> str:
             url = upload_episode_transcript(
+                audio_hash=audio_hash,
                 url_hash=podcast.url_hash,
-                episode_guid=episode.guid,
-                transcript_json=transcription.model_dump_json(),
+                transcript=pack_transcript(transcription),
             )
             logger.info(f"Uploaded transcript for {episode.guid}")
             return url
 
-        with ThreadPoolExecutor() as executor:
+        ad_index = (
+            _load_ad_index(podcast, exclude_guids=[ep.guid for ep, *_ in downloaded])
+            if settings.AD_INDEX_ENABLED
+            else None
+        )
+
+        confirmed: list[tuple[int, AdvertisementData]] = []
+        with ThreadPoolExecutor(max_workers=settings.TASK_MAX_THREADS) as executor:
             transcript_futures = [
-                executor.submit(_upload_transcript, ep, tr)
-                for (ep, _, _), tr in zip(downloaded, transcriptions)
-            ]
-            ad_futures = [
-                executor.submit(extract_from_transcription, transcription=tr)
-                for tr in transcriptions
+                executor.submit(_upload_transcript, ep, audio_hash, tr)
+                for (ep, _, _, audio_hash), tr in zip(downloaded, transcriptions)
             ]
-            transcript_urls = [f.result() for f in transcript_futures]
-            ads_list = [f.result() for f in ad_futures]
 
-        for i, ((episode, temp_path, _), transcription) in enumerate(
-            zip(downloaded, transcriptions)
-        ):  # noqa: E501
-            ads = ads_list[i]
-            transcript_url = transcript_urls[i]
-            logger.info(f"Extracted {len(ads.ads_list)} ads from {episode.guid}")
+            for i, ads in extract_ads_batch(transcriptions, ad_index=ad_index):
+                episode, temp_path, _, audio_hash = downloaded[i]
+                transcript_url = transcript_futures[i].result()
+                ads = merge_ads(
+                    known_spots[i] + ads.ads_list,
+                    tolerance_seconds=settings.AD_EXTRACTION_MERGE_TOLERANCE_SECONDS,
+                )
+                logger.info(f"Extracted {len(ads.ads_list)} ads from {episode.guid}")
 
-            temp_output = remove_ads_from_audio(input_path=temp_path, ads=ads)
-            temp_files.append(temp_output)
+                audio, temp_output = _cut_and_upload(
+                    audio_hash, temp_path, ads, podcast.output_profile
+                )
+                temp_files.append(temp_output)
 
-            s3_url = upload_episode_audio(
-                url_hash=podcast.url_hash,
-                episode_guid=episode.guid,
-                audio_path=temp_output,
+                Episode.upsert(
+                    podcast,
+                    episode.guid,
+                    audio_hash=audio_hash,
+                    transcript_url=transcript_url,
+                    **_cleaned_fields(audio, ads),
+                )
+                confirmed.append((i, ads))
+
+        if ad_index is not None:
+            # Updated only once every extraction using the index has finished
+            _learn_ads(
+                podcast,
+                [(transcriptions[i], ads) for i, ads in confirmed],
+                exclude_guids=[ep.guid for ep, *_ in downloaded],
             )
-            logger.info(f"Uploaded processed audio for {episode.guid}")
-
-            podcast.processed_episodes[episode.guid] = {
-                "original_url": episode.url,
-                "title": episode.title,
-                "s3_url": s3_url,
-                "transcript_url": transcript_url,
-                "ads": ads.model_dump(),
-            }
 
-        podcast.status = Podcast.Status.READY
-        podcast.last_refreshed_at = timezone.now()
-        podcast.save()
-        logger.info(f"Processed {len(new_episodes)} episodes for {podcast.title}")
+        if spot_library is not None:
+            _learn_spots(spot_library, [(fingerprints[i], ads) for i, ads in confirmed])
+
+    except Exception:
+        podcast.episodes.filter(
+            guid__in=[ep.guid for ep in new_episodes],
+            status=Episode.Status.PROCESSING,
+        ).update(status=Episode.Status.FAILED)
+        # Anything uploaded before the failure is no longer needed
+        _delete_unreferenced_audio_later([audio_hash for *_, audio_hash in downloaded])
+        raise
+
+    finally:
+        for temp_file in temp_files:
+            if temp_file.exists():
+                temp_file.unlink()
+        _release(reservation)
+
+
+@task
+def reprocess_podcast(podcast_id: int, guids: list[str], deferrals: int = 0) -> None:
+    """Re-run ad extraction and cutting for already processed episodes.
 
-        regenerate_feed(
-            url=podcast.url,
-            url_hash=podcast.url_hash,
-            processed_episodes=podcast.processed_episodes,
-            podcast_title=podcast.title,
+    Transcripts are loaded from S3 instead of transcribing the audio again,
+    so only the original audio has to be downloaded to cut it. Like
+    `process_podcast`, it is skipped while another run holds the podcast.
+    """
+    try:
+        with Leases(ttl_seconds=settings.PROCESSING_LEASE_SECONDS) as leases:
+            if leases.acquire(podcast_key(podcast_id)):
+                _reprocess_podcast(podcast_id, guids, leases, deferrals)
+    except NotAdmitted:
+        _defer(reprocess_podcast, deferrals, podcast_id=podcast_id, guids=guids)
+
+
+def _reprocess_podcast(
+    podcast_id: int, guids: list[str], leases: Leases, deferrals: int
+) -> None:
+    podcast = Podcast.objects.get(id=podcast_id)
+    stored = [
+        episode
+        for episode in podcast.episodes.filter(
+            guid__in=guids, status=Episode.Status.READY
         )
+        if leases.acquire(episode_key(podcast.id, episode.guid))
+    ]
+    if not stored:
+        logger.info(f"No processed episodes to reprocess for {podcast.title}")
+        return
+    logger.info(f"Reprocessing {len(stored)} episodes of {podcast.title}")
+
+    podcast.set_status(Podcast.Status.PROCESSING)
+
+    temp_files: list[Path] = []
+    reservation = None
+    audio_hashes: list[str] = []
+    try:
+        with ThreadPoolExecutor(max_workers=settings.TASK_MAX_THREADS) as executor:
+            transcripts = list(
+                executor.map(
+                    lambda episode: get_episode_transcript(
+                        url_hash=podcast.url_hash,
+                        episode_guid=episode.guid,
+                        audio_hash=episode.audio_hash,
+                        transcript_url=episode.transcript_url,
+                    ),
+                    stored,
+                )
+            )
+            for episode, transcript in zip(stored, transcripts):
+                if transcript is None:
+                    logger.warning(f"No stored transcript for {episode.guid}, skipping")
+            episodes = [
+                episode
+                for episode, transcript in zip(stored, transcripts)
+                if transcript is not None
+            ]
+            transcriptions = [
+                load_transcript(transcript)
+                for transcript in transcripts
+                if transcript is not None
+            ]
+
+            sources = [
+                FeedEpisode(guid=ep.guid, url=ep.original_url, title=ep.title)
+                for ep in episodes
+            ]
+            reservation = _admit(sources, deferrals)
+            downloaded = list(executor.map(_download_episode, sources))
+            temp_files.extend(temp_path for temp_path, _ in downloaded)
+            audio_hashes = [_audio_hash(audio) for _, audio in downloaded]
+
+            # The stored transcripts skip known spots, so match them again
+            spot_library = _get_spot_library(podcast)
+            known_spots: list[list[AdvertisementItem]] = [[] for _ in episodes]
+            if spot_library is not None:
+                known_spots = [
+                    spot_library.match(fingerprint_audio(audio))
+                    for _, audio in downloaded
+                ]
+
+            # The recurring-ad index holds labels from the previous prompt, so
+            # every episode goes through the LLM again
+            cuts = {}
+            for i, ads in extract_ads_batch(transcriptions):
+                ads = merge_ads(
+                    known_spots[i] + ads.ads_list,
+                    tolerance_seconds=settings.AD_EXTRACTION_MERGE_TOLERANCE_SECONDS,
+                )
+                logger.info(
+                    f"Extracted {len(ads.ads_list)} ads from {episodes[i].guid}"
+                )
+                future = executor.submit(
+                    _cut_and_upload,
+                    audio_hashes[i],
+                    downloaded[i][0],
+                    ads,
+                    podcast.output_profile,
+                )
+                cuts[future] = (i, ads)
+
+            for future in as_completed(cuts):
+                i, ads = cuts[future]
+                audio, temp_output = future.result()
+                temp_files.append(temp_output)
+                fields = _cleaned_fields(audio, ads)
+                if episodes[i].audio_hash != audio_hashes[i]:
+                    # Moves transcripts stored under the guid to the audio's key
+                    fields["transcript_url"] = upload_episode_transcript(
+                        audio_hash=audio_hashes[i],
+                        url_hash=podcast.url_hash,
+                        transcript=pack_transcript(transcriptions[i]),
+                    )
+                Episode.upsert(
+                    podcast, episodes[i].guid, audio_hash=audio_hashes[i], **fields
+                )
+
+        podcast.set_status(Podcast.Status.READY)
+        logger.info(f"Reprocessed {len(episodes)} episodes for {podcast.title}")
+
+        _regenerate_feed(podcast)
+
+    except NotAdmitted:
+        # The stored episodes are untouched and still READY
+        podcast.set_status(Podcast.Status.READY)
+        raise
 
     except Exception as e:
-        logger.error(f"Failed to process podcast {podcast.title}: {e}")
-        podcast.status = Podcast.Status.FAILED
-        podcast.save(update_fields=["status"])
+        logger.error(f"Failed to reprocess podcast {podcast.title}: {e}")
+        podcast.set_status(Podcast.Status.FAILED)
         raise
 
     finally:
         for temp_file in temp_files:
             if temp_file.exists():
                 temp_file.unlink()
+        _release(reservation)
+        if audio_hashes:
+            # Cuts and transcripts the episodes pointed at before
+            _delete_unreferenced_audio_later(
+                [episode.audio_hash for episode in stored] + audio_hashes
+            )
+
+
+@task
+def delete_podcast_objects(url_hash: str, audio_hashes: list[str]) -> None:
+    """Delete a removed podcast's objects, keeping audio other feeds still use."""
+    # Unless the same feed was added again in the meantime
+    if not Podcast.objects.filter(url_hash=url_hash).exists():
+        deleted = delete_prefix(f"{url_hash}/")
+        logger.info(f"Deleted {deleted} objects of podcast {url_hash}")
+
+    _delete_unreferenced_audio(audio_hashes)
+
+
+@task
+def delete_unreferenced_audio(audio_hashes: list[str]) -> None:
+    _delete_unreferenced_audio(audio_hashes)
+
+
+def _delete_unreferenced_audio_later(audio_hashes: list[str]) -> None:
+    """Clean up after a run once anything it uploaded is past the grace period."""
+    delete_unreferenced_audio.using(  # type: ignore[attr-defined]
+        run_after=timezone.now()
+        + timedelta(seconds=settings.AUDIO_CLEANUP_GRACE_SECONDS)
+    ).enqueue(audio_hashes=sorted({h for h in audio_hashes if h}))
+
+
+def _delete_unreferenced_audio(audio_hashes: list[str]) -> None:
+    """Delete the cuts and transcripts stored under each audio that no episode
+    points at.
+
+    References are the episode rows' URLs, so there is no separate count to
+    drift out of step. Results are copied to other feeds under the audio's
+    lease, which is held here from the check through the delete. Objects newer
+    than AUDIO_CLEANUP_GRACE_SECONDS are kept, as their run may not have
+    recorded them yet.
+    """
+    modified_before = timezone.now() - timedelta(
+        seconds=settings.AUDIO_CLEANUP_GRACE_SECONDS
+    )
+    for audio_hash in sorted(set(audio_hashes)):
+        with exclusive([_audio_key(audio_hash)]) as acquired:
+            if not acquired:
+                logger.warning(f"Keeping audio {audio_hash}, it is being copied")
+                continue
+            referenced = {
+                object_key(url)
+                for urls in Episode.objects.filter(audio_hash=audio_hash).values_list(
+                    "s3_url", "transcript_url"
+                )
+                for url in urls
+                if url
+            }
+            deleted = delete_prefix(
+                audio_prefix(audio_hash),
+                keep=referenced,
+                modified_before=modified_before,
+            )
+            logger.info(f"Deleted {deleted} unreferenced objects of audio {audio_hash}")
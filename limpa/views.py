@@ -1,17 +1,41 @@
+import asyncio
 import logging
 
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.validators import URLValidator
 from django.db import IntegrityError
-from django.http import HttpResponse
-from django.shortcuts import get_object_or_404, render
-from django.views.decorators.http import require_GET, require_http_methods, require_POST
-
-from limpa.models import Podcast
-from limpa.services.feed import FeedError, fetch_and_validate_feed
-from limpa.services.s3 import get_feed_xml, upload_feed_xml
-from limpa.tasks import process_podcast
+from django.http import Http404, HttpResponse
+from django.shortcuts import (
+    aget_object_or_404,
+    get_object_or_404,
+    redirect,
+    render,
+)
+from django.views.decorators.http import (
+    require_GET,
+    require_http_methods,
+    require_POST,
+    require_safe,
+)
+
+from limpa.leases import claim_episode, episode_key
+from limpa.models import CARD_FIELDS, Episode, Podcast, ProcessingLease
+from limpa.services.s3 import get_feed_xml
+from limpa.services.schedule import MAX_PRIORITY
+from limpa.tasks import delete_podcast_objects, onboard_podcast, process_episode
 
 logger = logging.getLogger(__name__)
 
+# Listing and polling load only what a card renders
+PODCAST_CARD_FIELDS = [*CARD_FIELDS, "change_seq"]
+ACTIVE_STATUSES = [Podcast.Status.PENDING, Podcast.Status.PROCESSING]
+ACTIVE_POLL_SECONDS = 5
+# Scheduled refreshes change podcasts with nobody on the page acting, so an
+# idle page keeps polling, just slowly
+IDLE_POLL_SECONDS = 60
+
 
 def _error_response(request, message: str):
     return render(
@@ -19,9 +43,46 @@ def _error_response(request, message: str):
     )
 
 
+def _poll_token(seen: dict[int, int]) -> str:
+    """The change token for the cards on a page: each podcast's `change_seq`."""
+    return ",".join(f"{podcast_id}:{seq}" for podcast_id, seq in seen.items())
+
+
+def _parse_poll_token(value: str | None) -> dict[int, int]:
+    seen = {}
+    for part in (value or "").split(","):
+        podcast_id, _, seq = part.partition(":")
+        try:
+            seen[int(podcast_id)] = int(seq)
+        except ValueError:
+            continue
+    return seen
+
+
+def _poller_context(token: str) -> dict:
+    active = Podcast.objects.filter(status__in=ACTIVE_STATUSES).exists()
+    return {
+        "token": token,
+        "poll_seconds": ACTIVE_POLL_SECONDS if active else IDLE_POLL_SECONDS,
+    }
+
+
+async def _apoller_context(token: str) -> dict:
+    active = await Podcast.objects.filter(status__in=ACTIVE_STATUSES).aexists()
+    return {
+        "token": token,
+        "poll_seconds": ACTIVE_POLL_SECONDS if active else IDLE_POLL_SECONDS,
+    }
+
+
 def home(request):
-    podcasts = Podcast.objects.all()
-    return render(request, "limpa/home.html", {"podcasts": podcasts})
+    podcasts = list(Podcast.objects.only(*PODCAST_CARD_FIELDS))
+    token = _poll_token({p.id: p.change_seq for p in podcasts})
+    return render(
+        request,
+        "limpa/home.html",
+        {"podcasts": podcasts, **_poller_context(token)},
+    )
 
 
 @require_POST  # ty: ignore[invalid-argument-type]
@@ -32,49 +93,143 @@ def add_podcast(request):
         return _error_response(request, "Please enter a podcast feed URL")
 
     try:
-        feed_data = fetch_and_validate_feed(url)
-    except FeedError as e:
-        logger.warning("Feed validation failed for %s: %s", url, e)
-        return _error_response(request, str(e))
+        URLValidator(schemes=["http", "https"])(url)
+    except ValidationError:
+        return _error_response(request, "Please enter a valid feed URL")
 
+    # The feed is fetched and validated in the background; until then the
+    # card shows the URL
     try:
-        podcast = Podcast.objects.create(
-            url=url, title=feed_data.title, episode_count=feed_data.episode_count
-        )
+        podcast = Podcast.objects.create(url=url, title=url[:500])
     except IntegrityError:
         return _error_response(request, "This podcast has already been added")
 
-    try:
-        upload_feed_xml(url_hash=podcast.url_hash, xml_content=feed_data.raw_xml)
-        logger.info("Uploaded feed for podcast %s", podcast.title)
-    except Exception as e:
-        podcast.status = Podcast.Status.FAILED
-        podcast.save()
-        logger.error("S3 upload failed for podcast %s: %s", podcast.title, e)
-
-    process_podcast.enqueue(podcast_id=podcast.id)  # type: ignore[attr-defined]
+    onboard_podcast.enqueue(podcast_id=podcast.id)  # type: ignore[attr-defined]
 
-    return render(request, "limpa/home.html#podcast_item", {"podcast": podcast})
+    # The new podcast is pending, so the poller speeds up. It keeps the page's
+    # own token, sent along with the form, so changes made to other podcasts
+    # since its last poll aren't skipped
+    seen = _parse_poll_token(request.POST.get("since"))
+    token = _poll_token({**seen, podcast.id: podcast.change_seq})
+    return render(
+        request,
+        "limpa/home.html#added_podcast",
+        {"podcast": podcast, **_poller_context(token)},
+    )
 
 
 @require_http_methods(["DELETE"])
 def delete_podcast(request, podcast_id: int):
     podcast = get_object_or_404(Podcast, id=podcast_id)
+    audio_hashes = list(
+        podcast.episodes.exclude(audio_hash="")
+        .values_list("audio_hash", flat=True)
+        .distinct()
+    )
     podcast.delete()
     logger.info("Deleted podcast %s", podcast.title)
+    delete_podcast_objects.enqueue(  # type: ignore[attr-defined]
+        url_hash=podcast.url_hash, audio_hashes=audio_hashes
+    )
     return HttpResponse("")
 
 
 @require_GET  # ty: ignore[invalid-argument-type]
-def serve_feed(request, url_hash: str):
-    podcast = get_object_or_404(Podcast, url_hash=url_hash)
-    feed_xml = get_feed_xml(url_hash=podcast.url_hash)
+async def serve_feed(request, url_hash: str):
+    if not await Podcast.objects.filter(url_hash=url_hash).aexists():
+        raise Http404
+    # boto3 blocks, so the read runs in a thread and the event loop stays free
+    feed_xml = await asyncio.to_thread(get_feed_xml, url_hash=url_hash)
     if feed_xml is None:
         return HttpResponse(status=404)
     return HttpResponse(feed_xml, content_type="application/xml")
 
 
+def _claim_episode(episode: Episode) -> bool:
+    """Mark an episode nobody is working on as processing.
+
+    Pending and failed episodes are free, and so is a processing one without
+    a live lease, whose worker died or whose run was deferred.
+    """
+    if episode.status == Episode.Status.PROCESSING and ProcessingLease.held(
+        [episode_key(episode.podcast_id, episode.guid)]
+    ):
+        return False
+    if not claim_episode(
+        episode.podcast_id, episode.guid, settings.ON_DEMAND_CLAIM_SECONDS
+    ):
+        return False
+    return bool(
+        Episode.objects.filter(
+            id=episode.id,
+            status__in=[
+                Episode.Status.PENDING,
+                Episode.Status.FAILED,
+                Episode.Status.PROCESSING,
+            ],
+        ).update(status=Episode.Status.PROCESSING)
+    )
+
+
+@require_safe  # ty: ignore[invalid-argument-type]
+async def episode_audio(request, episode_id: int):
+    """Enclosure of an episode in on-demand mode.
+
+    The first listener request claims a pending episode and enqueues it ahead
+    of scheduled refreshes. Failed episodes, and ones whose worker died, are
+    claimed again the same way. Until the ad-free audio exists, every request
+    is redirected to the original.
+
+    Podcast apps fetch every enclosure through here, so the view is async and
+    READY episodes cost a single query.
+    """
+    episode = await aget_object_or_404(
+        Episode.objects.only("podcast_id", "guid", "status", "s3_url", "original_url"),
+        id=episode_id,
+    )
+    if episode.status == Episode.Status.READY and episode.s3_url:
+        return redirect(episode.s3_url)
+
+    if request.method == "GET" and await sync_to_async(_claim_episode)(episode):
+        await process_episode.using(priority=MAX_PRIORITY).aenqueue(  # type: ignore[attr-defined]
+            episode_id=episode_id
+        )
+        logger.info("Enqueued on-demand processing for episode %s", episode_id)
+    return redirect(episode.original_url)
+
+
 @require_GET  # ty: ignore[invalid-argument-type]
-def podcast_stats(request, podcast_id: int):
-    podcast = get_object_or_404(Podcast, id=podcast_id)
-    return render(request, "limpa/home.html#podcast_stats", {"podcast": podcast})
+async def podcast_status(request):
+    """One poll for every card on the page.
+
+    `since` is the change token from the previous response. Only podcasts
+    changed after it are sent back, as out-of-band swaps, and the poller slows
+    down once no podcast is pending or processing.
+    """
+    seen = _parse_poll_token(request.GET.get("since"))
+
+    current = {
+        podcast_id: seq
+        async for podcast_id, seq in Podcast.objects.filter(id__in=seen).values_list(
+            "id", "change_seq"
+        )
+    }
+    changed_ids = [
+        podcast_id for podcast_id, seq in current.items() if seq != seen[podcast_id]
+    ]
+    changed = (
+        [
+            podcast
+            async for podcast in Podcast.objects.only(*PODCAST_CARD_FIELDS).filter(
+                id__in=changed_ids
+            )
+        ]
+        if changed_ids
+        else []
+    )
+    token = _poll_token(current)
+    return render(
+        request,
+        "limpa/home.html#status_update",
+        {"podcasts": changed, **await _apoller_context(token)},
+    )